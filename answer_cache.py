@@ -0,0 +1,182 @@
+import os
+import time
+import itertools
+import threading
+from collections import OrderedDict
+import numpy as np
+from embedding_models import get_model, DEFAULT_EMB_MODEL
+
+
+ANSWER_CACHE_ENABLED = os.getenv("DEEPRECALL_ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("DEEPRECALL_ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("DEEPRECALL_ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("DEEPRECALL_ANSWER_CACHE_TTL", "86400"))
+# how long a document with a pending delete is kept out of new cache entries if its delete
+# task is never seen completing
+ANSWER_CACHE_DELETE_GRACE = float(os.getenv("DEEPRECALL_ANSWER_CACHE_DELETE_GRACE", "600"))
+# a few default refresh intervals
+DELETE_REFRESH_SLACK = 5.0
+
+
+class SemanticAnswerCache:
+    def __init__(
+        self,
+        threshold=ANSWER_CACHE_THRESHOLD,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        ttl=ANSWER_CACHE_TTL,
+        emb_model=DEFAULT_EMB_MODEL,
+        delete_grace=ANSWER_CACHE_DELETE_GRACE
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.delete_grace = delete_grace
+        self._deleting = {}
+        self._delete_tasks = {}
+        self.emb_model = emb_model
+        self._entries = OrderedDict()
+        self._by_doc = {}
+        self._ids = itertools.count()
+        self._matrix = None
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "expirations": 0}
+
+    def embed(self, query):
+        return get_model(self.emb_model).encode(query, normalize_embeddings=True).astype(np.float32)
+
+    def lookup(self, embedding):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if not self._entries:
+                self._stats["misses"] += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries)
+                self._matrix = np.stack([self._entries[key]["embedding"] for key in self._matrix_keys])
+
+            # embeddings are unit length, so the dot product is the cosine similarity
+            scores = self._matrix @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self._stats["misses"] += 1
+                return None
+
+            key = self._matrix_keys[best]
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            entry = self._entries[key]
+            return {
+                "answer": entry["answer"],
+                "similarity": round(float(scores[best]), 4),
+                "cached_query": entry["query"],
+                "doc_ids": sorted(entry["doc_ids"])
+            }
+
+    def store(self, query, embedding, answer, doc_ids):
+        with self._lock:
+            self._expire_deletes(time.monotonic())
+            if any(doc_id in self._deleting for doc_id in doc_ids):
+                # drawn from a document that is being deleted but may still be retrievable
+                return False
+
+            key = next(self._ids)
+            self._entries[key] = {
+                "query": query,
+                "embedding": embedding,
+                "answer": answer,
+                "doc_ids": set(doc_ids),
+                "stored_at": time.monotonic()
+            }
+            for doc_id in doc_ids:
+                self._by_doc.setdefault(doc_id, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+            self._matrix = None
+            return True
+
+    def begin_delete(self, doc_ids, task_ids=()):
+        # deletes run as background tasks without a refresh, so the documents stay
+        # retrievable for a while; keep them out of new entries until the tasks complete
+        expires = time.monotonic() + self.delete_grace
+        with self._lock:
+            for doc_id in doc_ids:
+                self._deleting[doc_id] = expires
+            for task_id in task_ids:
+                self._delete_tasks[task_id] = (list(doc_ids), expires)
+        for doc_id in doc_ids:
+            self.invalidate_doc(doc_id)
+
+    def end_delete(self, task_id):
+        # the deleted paragraphs only disappear from search at the next refresh, so the
+        # documents stay blocked for a little longer than the task itself
+        settle = time.monotonic() + DELETE_REFRESH_SLACK
+        with self._lock:
+            doc_ids, _ = self._delete_tasks.pop(task_id, ([], None))
+            # a bulk delete runs one task per index; wait for the last of them
+            still_running = {doc_id for ids, _ in self._delete_tasks.values() for doc_id in ids}
+            for doc_id in doc_ids:
+                if doc_id not in still_running and doc_id in self._deleting:
+                    self._deleting[doc_id] = min(self._deleting[doc_id], settle)
+        for doc_id in doc_ids:
+            self.invalidate_doc(doc_id)
+
+    def _expire_deletes(self, now):
+        for doc_id in [doc_id for doc_id, expires in self._deleting.items() if expires <= now]:
+            del self._deleting[doc_id]
+        for task_id in [task_id for task_id, (_, expires) in self._delete_tasks.items() if expires <= now]:
+            del self._delete_tasks[task_id]
+
+    def invalidate_doc(self, doc_id):
+        with self._lock:
+            keys = self._by_doc.pop(doc_id, set())
+            for key in keys:
+                if key in self._entries:
+                    self._remove(key)
+            if keys:
+                self._stats["invalidations"] += len(keys)
+                self._matrix = None
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_doc.clear()
+            self._deleting.clear()
+            self._delete_tasks.clear()
+            self._matrix = None
+
+    def _expire(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry["stored_at"] > self.ttl]
+        for key in expired:
+            self._remove(key)
+        if expired:
+            self._stats["expirations"] += len(expired)
+            self._matrix = None
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for doc_id in entry["doc_ids"]:
+            keys = self._by_doc.get(doc_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_doc[doc_id]
+        self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+        stats["threshold"] = self.threshold
+        stats["max_entries"] = self.max_entries
+        return stats
+
+
+answer_cache = SemanticAnswerCache()
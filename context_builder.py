@@ -0,0 +1,108 @@
+import os
+import re
+from token_counting import count_tokens, truncate_to_tokens
+
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("DEEPRECALL_CONTEXT_TOKEN_BUDGET", "1500"))
+CONTEXT_CANDIDATES = int(os.getenv("DEEPRECALL_CONTEXT_CANDIDATES", "10"))
+DEDUP_THRESHOLD = float(os.getenv("DEEPRECALL_CONTEXT_DEDUP_THRESHOLD", "0.8"))
+
+
+def _shingles(text, size=3):
+    words = re.findall(r"\w+", text.casefold())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _merge_adjacent(passages):
+    # consecutive paragraphs of one page read better (and tokenize cheaper) as one block
+    groups = {}
+    for passage in passages:
+        groups.setdefault((passage["doc_id"], passage["page_no"]), []).append(passage)
+
+    merged = []
+    for group in groups.values():
+        group.sort(key=lambda p: p["para_no"] if p["para_no"] is not None else -1)
+        current = None
+        for passage in group:
+            if (
+                current is not None
+                and passage["para_no"] is not None
+                and current["para_to"] is not None
+                and passage["para_no"] == current["para_to"] + 1
+            ):
+                current["text"] += "\n" + passage["text"]
+                current["para_to"] = passage["para_no"]
+                current["score"] = max(current["score"], passage["score"])
+                current["tokens"] += passage["tokens"]
+                continue
+
+            current = dict(passage, para_from=passage["para_no"], para_to=passage["para_no"])
+            current.pop("para_no")
+            merged.append(current)
+
+    merged.sort(key=lambda p: p["score"], reverse=True)
+    return merged
+
+
+def build_context(hits, token_budget=CONTEXT_TOKEN_BUDGET, dedup_threshold=DEDUP_THRESHOLD):
+    candidates = []
+    for hit in hits:
+        src = hit.get("_source", {})
+        text = (src.get("text") or "").strip()
+        if not text:
+            continue
+        candidates.append({
+            "doc_id": src.get("doc_id"),
+            "page_no": src.get("page_no"),
+            "para_no": src.get("para_no"),
+            "text": text,
+            "score": hit.get("_score") or 0.0
+        })
+    candidates.sort(key=lambda p: p["score"], reverse=True)
+
+    selected = []
+    seen_shingles = []
+    used = 0
+    for passage in candidates:
+        shingles = _shingles(passage["text"])
+        if any(_jaccard(shingles, other) >= dedup_threshold for other in seen_shingles):
+            continue
+
+        tokens = count_tokens(passage["text"])
+        if used + tokens > token_budget:
+            if selected:
+                # a lower-scored but shorter passage may still fit
+                continue
+            # the single best passage is larger than the whole budget; keep its head
+            passage["text"] = truncate_to_tokens(passage["text"], token_budget)
+            tokens = count_tokens(passage["text"])
+
+        passage["tokens"] = tokens
+        selected.append(passage)
+        seen_shingles.append(shingles)
+        used += tokens
+
+    passages = _merge_adjacent(selected)
+    blocks = []
+    for passage in passages:
+        paras = (
+            f"{passage['para_from']}"
+            if passage["para_from"] == passage["para_to"]
+            else f"{passage['para_from']}-{passage['para_to']}"
+        )
+        blocks.append(f"[{passage['doc_id']} page {passage['page_no']} para {paras}]\n{passage['text']}")
+
+    return {
+        "context": "\n\n".join(blocks),
+        "passages": passages,
+        "tokens": used,
+        "token_budget": token_budget
+    }
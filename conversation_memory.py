@@ -0,0 +1,76 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from token_counting import count_tokens
+
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("DEEPRECALL_HISTORY_TOKEN_BUDGET", "1500"))
+SESSION_IDLE_SECONDS = float(os.getenv("DEEPRECALL_SESSION_IDLE_SECONDS", "1800"))
+MAX_SESSIONS = int(os.getenv("DEEPRECALL_MAX_SESSIONS", "10000"))
+DEFAULT_SESSION = "default"
+
+
+class SessionStore:
+    def __init__(self, token_budget=HISTORY_TOKEN_BUDGET, idle_seconds=SESSION_IDLE_SECONDS, max_sessions=MAX_SESSIONS):
+        self.token_budget = token_budget
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def history(self, session_id=DEFAULT_SESSION):
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            session["last_access"] = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return [{"role": turn["role"], "content": turn["content"]} for turn in session["turns"]]
+
+    def add_turn(self, session_id, role, content):
+        # token count taken outside the lock; tokenizing is the slow part
+        tokens = count_tokens(content)
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = {"turns": [], "tokens": 0, "last_access": time.monotonic()}
+                self._sessions[session_id] = session
+
+            session["turns"].append({"role": role, "content": content, "tokens": tokens})
+            session["tokens"] += tokens
+            session["last_access"] = time.monotonic()
+            self._sessions.move_to_end(session_id)
+
+            # drop the oldest turns until the stored history fits the budget
+            while session["tokens"] > self.token_budget and len(session["turns"]) > 1:
+                session["tokens"] -= session["turns"].pop(0)["tokens"]
+            # never open the history with a dangling assistant reply
+            while session["turns"] and session["turns"][0]["role"] == "assistant" and len(session["turns"]) > 1:
+                session["tokens"] -= session["turns"].pop(0)["tokens"]
+
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def clear(self, session_id=DEFAULT_SESSION):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        # sessions are kept in access order, so idle ones sit at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session["last_access"] >= cutoff:
+                break
+            del self._sessions[session_id]
+
+    def stats(self):
+        with self._lock:
+            self._evict_idle()
+            return {
+                "sessions": len(self._sessions),
+                "token_budget": self.token_budget,
+                "idle_seconds": self.idle_seconds
+            }
@@ -1,10 +1,11 @@
-from fastapi import FastAPI, UploadFile, File,Form
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
 import csv
+import asyncio
 import tempfile
-from retrieval import retrieve
+from retrieval import retrieve_with_sources, query_metadata_cache
 import io
 from typing import Optional, Dict, List, Any
 from pydantic import BaseModel
@@ -12,11 +13,30 @@ import uvicorn
 import json
 from final_functions import process_and_index_document
 from vectordb_functions import clear_vector_index
-from fuzzy_metadata_search import existing_doc_ids, view_all_entries, view_doc_by_id, empty_index,delete_document_by_doc_id
-from llm import chat_with_llm
+from fuzzy_metadata_search import existing_doc_ids, list_entries_page, iter_entries, view_doc_by_id, empty_index,delete_document_by_doc_id, delete_documents, get_task_status
+from llm import chat_with_llm, chat_with_llm_stream, record_turn, SESSIONS
+from embedding_models import warm_up, model_stats
+from executors import run_blocking, stream_blocking, ingest_executor, io_executor, shutdown_executors
+from ingestion_jobs import submit_job, get_job, list_jobs
+from ocr_cache import cache_stats as ocr_cache_stats
+from answer_cache import answer_cache, ANSWER_CACHE_ENABLED
+from metadata_export import iter_export, EXPORT_FORMATS, EXPORT_BATCH_SIZE
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:
+    # python-multipart releases before 0.0.13 install as `multipart`
+    from multipart.multipart import MultipartParser, parse_options_header
 
 app = FastAPI(title="Text & File Processing API", version="1.0.0")
 
+# uploads land in a private (0700) per-process directory, never the working directory
+UPLOAD_DIR = os.getenv("DEEPRECALL_UPLOAD_DIR") or tempfile.mkdtemp(prefix="deeprecall-uploads-")
+MAX_UPLOAD_BYTES = int(os.getenv("DEEPRECALL_MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("DEEPRECALL_UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# room for multipart boundaries, part headers and the small form fields next to the file
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024
+MAX_ENTRIES_PAGE = int(os.getenv("DEEPRECALL_MAX_ENTRIES_PAGE", "1000"))
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -27,6 +47,7 @@ app.add_middleware(
 
 class TextInput(BaseModel):
     text: str
+    session_id: Optional[str] = None
 
 class TextOutput(BaseModel):
     result: str
@@ -34,15 +55,43 @@ class TextOutput(BaseModel):
 class FileProcessRequest(BaseModel):
     doc_id: str
 
+class BulkDeleteRequest(BaseModel):
+    doc_ids: List[str]
+    refresh: bool = False
+
+
+@app.on_event("startup")
+async def load_embedding_models():
+    stats = warm_up()
+    print(f"Embedding models ready: {stats}")
+
+
+@app.on_event("shutdown")
+async def stop_executors():
+    shutdown_executors(wait=False)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    if not fields:
+        return None
+    return [f.strip() for f in fields.split(",") if f.strip()]
+
 
 @app.get("/entries")
-async def get_all_entries():
+async def get_all_entries(limit: int = 100, cursor: Optional[str] = None, fields: Optional[str] = None):
     try:
-        docs = view_all_entries()
+        page = await run_blocking(
+            "entries",
+            list_entries_page,
+            limit=max(1, min(limit, MAX_ENTRIES_PAGE)),
+            cursor=cursor,
+            fields=parse_fields(fields)
+        )
         return {
             "success": True,
-            "count": len(docs),
-            "data": docs
+            "count": len(page["data"]),
+            "data": page["data"],
+            "next_cursor": page["next_cursor"]
         }
     except Exception as e:
         return {
@@ -51,10 +100,119 @@ async def get_all_entries():
             "message": str(e)
         }
 
+
+async def prefetch_stream(chunks):
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        return chunks
+
+    async def body():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return body()
+
+
+@app.get("/entries/stream")
+async def stream_all_entries(fields: Optional[str] = None, batch_size: int = 500):
+    batch_size = max(1, min(batch_size, MAX_ENTRIES_PAGE))
+    fields = parse_fields(fields)
+
+    # one JSON document per line, written as each PIT page is read
+    def lines():
+        for doc in iter_entries(batch_size=batch_size, fields=fields):
+            yield json.dumps(doc, default=str) + "\n"
+
+    # PIT pages are read on the IO executor under the entries limit, not starlette's threadpool
+    return StreamingResponse(stream_blocking("entries", lines), media_type="application/x-ndjson")
+
+@app.get("/export")
+async def export_entries(
+    format: str = "csv",
+    fields: Optional[str] = None,
+    doc_ids: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+):
+    try:
+        chunks = iter_export(
+            format,
+            fields=parse_fields(fields),
+            doc_ids=parse_fields(doc_ids),
+            start=start,
+            end=end,
+            batch_size=max(1, min(batch_size, MAX_ENTRIES_PAGE))
+        )
+        # the first chunk opens the PIT and reads the first page; pulling it before the
+        # headers go out lets OpenSearch errors come back as JSON instead of a cut-off 200
+        body = await prefetch_stream(stream_blocking("entries", lambda: chunks))
+    except Exception as e:
+        return {
+            "success": False,
+            "error": "EXPORT_FAILED",
+            "message": str(e)
+        }
+
+    media_type, extension = EXPORT_FORMATS[format]
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="deeprecall-metadata.{extension}"'}
+    )
+
+
+@app.post("/documents/delete")
+async def delete_documents_bulk(request: BulkDeleteRequest):
+    try:
+        answer_cache.begin_delete(request.doc_ids)
+        result = await run_blocking("delete", delete_documents, request.doc_ids, refresh=request.refresh)
+        task_ids = [
+            result[key]["task_id"]
+            for key in ("metadata_index", "vector_index")
+            if result.get(key) and result[key].get("task_id")
+        ]
+        answer_cache.begin_delete(request.doc_ids, task_ids)
+        return result
+
+    except Exception as e:
+        return {
+            "success": False,
+            "error": "DELETE_FAILED",
+            "message": str(e),
+            "doc_ids": request.doc_ids
+        }
+
+
+@app.get("/tasks/{task_id}")
+async def get_task(task_id: str):
+    try:
+        status = await run_blocking("entries", get_task_status, task_id)
+        if status["completed"]:
+            # drops answers cached from the documents while the delete was still running
+            answer_cache.end_delete(task_id)
+        return {
+            "success": True,
+            "data": status
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "error": "TASK_NOT_FOUND",
+            "message": str(e),
+            "task_id": task_id
+        }
+
+
 @app.delete("/documents/{doc_id}")
-async def delete_document(doc_id: str):
+async def delete_document(doc_id: str, refresh: bool = False):
     try:
-        result = delete_document_by_doc_id(doc_id)
+        # without a refresh the paragraphs stay searchable for a moment; begin_delete keeps
+        # answers drawn from them out of the cache for the grace period
+        answer_cache.begin_delete([doc_id])
+        result = await run_blocking("delete", delete_document_by_doc_id, doc_id, refresh=refresh)
         return result
 
     except Exception as e:
@@ -67,9 +225,9 @@ async def delete_document(doc_id: str):
 
 
 @app.get("/entries/{doc_id}")
-async def get_entry_by_doc_id(doc_id: str):
+async def get_entry_by_doc_id(doc_id: str, fields: Optional[str] = None):
     try:
-        doc = view_doc_by_id(doc_id)
+        doc = await run_blocking("entries", view_doc_by_id, doc_id, fields=parse_fields(fields))
 
         if not doc:
             return {
@@ -100,9 +258,10 @@ async def clean_indexes():
         "vector_index": None,
         "metadata_index": None
     }
+    answer_cache.clear()
 
     try:
-        clear_vector_index("deeprecall-rc-vector")
+        await run_blocking("delete", clear_vector_index, "deeprecall-rc-vector")
         result["vector_index"] = {
             "action": "deleted",
             "index": "deeprecall-rc-vector"
@@ -115,7 +274,7 @@ async def clean_indexes():
         }
 
     try:
-        meta_res = empty_index("deeprecall-rc-fuzzy")
+        meta_res = await run_blocking("delete", empty_index, "deeprecall-rc-fuzzy")
         result["metadata_index"] = meta_res
         if not meta_res.get("success", False):
             result["success"] = False
@@ -132,36 +291,136 @@ async def clean_indexes():
 @app.post("/process-text", response_model=TextOutput)
 async def process_text(input_data: TextInput):
     user_query = input_data.text
-    retrieved_text=retrieve(user_query)
-    response= chat_with_llm(user_query,retrieved_text)
+    # no session_id means a stateless request: no history is read or written
+    session_id = input_data.session_id
+    query_embedding = None
+    # answers depend on the conversation so far, so only a session without history can share one
+    if ANSWER_CACHE_ENABLED and not (session_id and SESSIONS.history(session_id)):
+        query_embedding = await run_blocking("process-text", answer_cache.embed, user_query)
+        cached = answer_cache.lookup(query_embedding)
+        if cached is not None:
+            record_turn(session_id, user_query, cached["answer"])
+            return TextOutput(result=cached["answer"])
+
+    retrieved_text, doc_ids = await run_blocking("process-text", retrieve_with_sources, user_query)
+    response = await run_blocking("process-text", chat_with_llm, user_query, retrieved_text, session_id)
+
+    if query_embedding is not None and doc_ids:
+        answer_cache.store(user_query, query_embedding, response, doc_ids)
     return TextOutput(result=response)
 
 
+def sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.post("/process-text/stream")
+async def process_text_stream(input_data: TextInput):
+    user_query = input_data.text
+    session_id = input_data.session_id
+
+    query_embedding = None
+    if ANSWER_CACHE_ENABLED and not (session_id and SESSIONS.history(session_id)):
+        query_embedding = await run_blocking("process-text", answer_cache.embed, user_query)
+        cached = answer_cache.lookup(query_embedding)
+        if cached is not None:
+            record_turn(session_id, user_query, cached["answer"])
+
+            def replay():
+                yield sse_event({"token": cached["answer"]})
+                yield sse_event({"result": cached["answer"], "cached": True}, event="done")
+
+            return StreamingResponse(replay(), media_type="text/event-stream")
+
+    retrieved_text, doc_ids = await run_blocking("process-text", retrieve_with_sources, user_query)
+
+    # the Groq stream runs on a worker thread and holds a process-text slot until it ends
+    async def events():
+        parts = []
+        try:
+            async for token in stream_blocking("process-text", chat_with_llm_stream, user_query, retrieved_text, session_id):
+                parts.append(token)
+                yield sse_event({"token": token})
+        except Exception as e:
+            yield sse_event({"error": "LLM_FAILED", "message": str(e)}, event="error")
+            return
+
+        response = "".join(parts).strip()
+        if query_embedding is not None and doc_ids:
+            answer_cache.store(user_query, query_embedding, response, doc_ids)
+        yield sse_event({"result": response, "cached": False}, event="done")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/process-file")
-async def process_file(
-    file: UploadFile = File(...),
-    doc_id: Optional[str] = Form(None)
-):
-    print("doc_id =", doc_id)
-    duplicates = existing_doc_ids("deeprecall-rc-fuzzy", [doc_id])
-    if duplicates:
-        return {
-            "success": False,
-            "error": "DUPLICATE_DOC_ID",
-            "message": f"doc_id '{doc_id}' already exists"
-        }
+async def process_file(request: Request):
+    # multipart form with `file`, `doc_id` and `background`, parsed by save_upload as it
+    # arrives rather than through UploadFile, which Starlette spools in full first
     file_path = None
+    doc_id = None
 
     try:
-        filename = file.filename or "uploaded_file"
-        safe_filename = f"temp_{doc_id}_{filename}" if doc_id else f"temp_{filename}"
-        file_path = os.path.join(os.getcwd(), safe_filename)
+        try:
+            file_path, fields = await save_upload(request)
+        except UploadTooLarge:
+            return {
+                "success": False,
+                "error": "UPLOAD_TOO_LARGE",
+                "message": f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit",
+                "doc_id": doc_id
+            }
 
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        doc_id = fields.get("doc_id") or None
+        background = fields.get("background", "false").lower() in ("1", "true", "yes", "on")
+        if file_path is None:
+            return {
+                "success": False,
+                "error": "UPLOAD_FAILED",
+                "message": "No file part in the upload",
+                "doc_id": doc_id
+            }
+
+        print("doc_id =", doc_id)
+        duplicates = await run_blocking("entries", existing_doc_ids, "deeprecall-rc-fuzzy", [doc_id])
+        if duplicates:
+            return {
+                "success": False,
+                "error": "DUPLICATE_DOC_ID",
+                "message": f"doc_id '{doc_id}' already exists"
+            }
 
-        result = process_and_index_document(os.path.basename(file_path), doc_id)
+        if background:
+            job_id = submit_job(file_path, doc_id)
+            if job_id is None:
+                return {
+                    "success": False,
+                    "error": "QUEUE_FULL",
+                    "message": "Ingestion queue is full, retry later",
+                    "doc_id": doc_id
+                }
+
+            # the job owns the file from here and removes it when it finishes
+            file_path = None
+            return {
+                "success": True,
+                "doc_id": doc_id,
+                "job_id": job_id,
+                "status": "queued"
+            }
+
+        result = await run_blocking(
+            "process-file",
+            process_and_index_document,
+            file_path,
+            doc_id,
+            executor=ingest_executor
+        )
 
         if not result.get("success"):
             return result
@@ -196,11 +455,171 @@ async def process_file(
             except Exception:
                 pass
 
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return {
+            "success": False,
+            "error": "NOT_FOUND",
+            "message": f"Job '{job_id}' not found"
+        }
+
+    return {
+        "success": True,
+        "data": job
+    }
+
+
+@app.get("/jobs")
+async def get_jobs(limit: int = 100):
+    jobs = list_jobs(limit)
+    return {
+        "success": True,
+        "count": len(jobs),
+        "data": jobs
+    }
+
+
+@app.delete("/sessions/{session_id}")
+async def clear_session(session_id: str):
+    return {
+        "success": SESSIONS.clear(session_id),
+        "session_id": session_id
+    }
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/models")
+async def get_model_stats():
+    return model_stats()
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return {
+        "ocr": await run_blocking("entries", ocr_cache_stats),
+        "query_metadata": query_metadata_cache.stats(),
+        "answers": answer_cache.stats(),
+        "sessions": SESSIONS.stats()
+    }
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+async def save_upload(request: Request):
+    # returns (file_path, form fields), file_path being None when there is no file part;
+    # raises UploadTooLarge as soon as the body is known to exceed MAX_UPLOAD_BYTES
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD_BYTES:
+        raise UploadTooLarge
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise ValueError("Expected a multipart/form-data upload")
+
+    # parser callbacks are synchronous, so they only queue events; the disk writes
+    # happen between body chunks, off the event loop
+    events = []
+    part_headers = {}
+    header = [b"", b""]
+
+    def on_part_begin():
+        part_headers.clear()
+
+    def on_header_field(data, start, end):
+        header[0] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header[1] += data[start:end]
+
+    def on_header_end():
+        part_headers[header[0].lower()] = header[1]
+        header[0], header[1] = b"", b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(part_headers.get(b"content-disposition", b""))
+        events.append(("begin", options.get(b"name", b"").decode(), options.get(b"filename")))
+
+    def on_part_data(data, start, end):
+        events.append(("data", data[start:end]))
+
+    def on_part_end():
+        events.append(("end", None))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end
+    })
+
+    loop = asyncio.get_running_loop()
+    file_path = None
+    f = None
+    part = None
+    values = {}
+    written = 0
+    pending = bytearray()
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event in events:
+                kind = event[0]
+                if kind == "begin":
+                    _, name, filename = event
+                    part = None
+                    if name == "file" and filename is not None and file_path is None:
+                        os.makedirs(UPLOAD_DIR, mode=0o700, exist_ok=True)
+                        filename = os.path.basename(filename.decode(errors="replace")) or "uploaded_file"
+                        doc_id = values.get("doc_id", b"").decode(errors="replace")
+                        # mkstemp gives every request its own file, so same-named parallel uploads can't collide
+                        fd, file_path = tempfile.mkstemp(prefix=f"temp_{doc_id}_" if doc_id else "temp_", suffix=f"_{filename}", dir=UPLOAD_DIR)
+                        f = os.fdopen(fd, "wb")
+                        part = "file"
+                    elif filename is None:
+                        values[name] = b""
+                        part = name
+                elif kind == "data" and part == "file":
+                    written += len(event[1])
+                    if written > MAX_UPLOAD_BYTES:
+                        raise UploadTooLarge
+                    # body chunks are small; hand the disk UPLOAD_CHUNK_BYTES at a time
+                    pending += event[1]
+                    if len(pending) >= UPLOAD_CHUNK_BYTES:
+                        await loop.run_in_executor(io_executor, f.write, bytes(pending))
+                        pending.clear()
+                elif kind == "data" and part is not None:
+                    values[part] += event[1]
+                    if len(values[part]) > UPLOAD_FORM_OVERHEAD_BYTES:
+                        raise ValueError(f"Form field '{part}' is too large")
+                elif kind == "end":
+                    part = None
+            events.clear()
+        parser.finalize()
+        if f is not None:
+            if pending:
+                await loop.run_in_executor(io_executor, f.write, bytes(pending))
+            f.close()
+    except Exception:
+        if f is not None:
+            f.close()
+            os.remove(file_path)
+        raise
+
+    return file_path, {name: value.decode(errors="replace") for name, value in values.items()}
+
+
 def process_saved_file(file_path: str, doc_id: Optional[str] = None) -> Dict[str, Any]:
     try:
         size = os.path.getsize(file_path)
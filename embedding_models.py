@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+import resource
+from sentence_transformers import SentenceTransformer
+
+
+DEFAULT_EMB_MODEL = os.getenv("DEEPRECALL_EMB_MODEL", "all-MiniLM-L6-v2")
+
+_models = {}
+_model_locks = {}
+_load_stats = {}
+_registry_lock = threading.Lock()
+
+
+def _rss_bytes():
+    # current resident set size; fall back to peak RSS where /proc is unavailable
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def get_model(emb_model=DEFAULT_EMB_MODEL):
+    model = _models.get(emb_model)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        lock = _model_locks.setdefault(emb_model, threading.Lock())
+
+    # per-model lock so concurrent callers wait for a single load instead of racing
+    with lock:
+        model = _models.get(emb_model)
+        if model is not None:
+            return model
+
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        model = SentenceTransformer(emb_model)
+        load_seconds = time.perf_counter() - start
+        rss_after = _rss_bytes()
+
+        _load_stats[emb_model] = {
+            "model": emb_model,
+            "load_seconds": round(load_seconds, 3),
+            "rss_before_mb": round(rss_before / (1024 * 1024), 1),
+            "rss_after_mb": round(rss_after / (1024 * 1024), 1),
+            "rss_delta_mb": round((rss_after - rss_before) / (1024 * 1024), 1),
+            "dimension": model.get_sentence_embedding_dimension(),
+        }
+        _models[emb_model] = model
+        print(
+            f"Loaded embedding model '{emb_model}' in {load_seconds:.2f}s "
+            f"(+{_load_stats[emb_model]['rss_delta_mb']} MB RSS)"
+        )
+        return model
+
+
+def warm_up(models=None):
+    for name in models or [DEFAULT_EMB_MODEL]:
+        # encode once so lazy kernels / tokenizer caches are built before the first request
+        get_model(name).encode(["warm up"])
+    return model_stats()
+
+
+def model_stats():
+    return {
+        "loaded": list(_load_stats.values()),
+        "rss_mb": round(_rss_bytes() / (1024 * 1024), 1),
+    }
+
+
+def unload_model(emb_model):
+    with _registry_lock:
+        _load_stats.pop(emb_model, None)
+        return _models.pop(emb_model, None) is not None
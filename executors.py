@@ -0,0 +1,88 @@
+import os
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+IO_WORKERS = int(os.getenv("DEEPRECALL_IO_WORKERS", "32"))
+INGEST_WORKERS = int(os.getenv("DEEPRECALL_INGEST_WORKERS", "4"))
+
+# max requests of each kind running at once; the rest wait on the event loop, not a thread
+ENDPOINT_LIMITS = {
+    "process-text": int(os.getenv("DEEPRECALL_LIMIT_PROCESS_TEXT", "16")),
+    "process-file": int(os.getenv("DEEPRECALL_LIMIT_PROCESS_FILE", "2")),
+    "entries": int(os.getenv("DEEPRECALL_LIMIT_ENTRIES", "8")),
+    "delete": int(os.getenv("DEEPRECALL_LIMIT_DELETE", "4")),
+}
+DEFAULT_LIMIT = int(os.getenv("DEEPRECALL_LIMIT_DEFAULT", "8"))
+
+# search / LLM calls are network bound; ingestion mixes OCR uploads with embedding,
+# so it gets its own small pool and cannot starve the query path
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="deeprecall-io")
+ingest_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="deeprecall-ingest")
+
+_semaphores = {}
+
+
+def _semaphore(endpoint):
+    sem = _semaphores.get(endpoint)
+    if sem is None:
+        sem = asyncio.Semaphore(ENDPOINT_LIMITS.get(endpoint, DEFAULT_LIMIT))
+        _semaphores[endpoint] = sem
+    return sem
+
+
+async def run_blocking(endpoint, fn, *args, executor=None, **kwargs):
+    async with _semaphore(endpoint):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor or io_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def stream_blocking(endpoint, fn, *args, executor=None, **kwargs):
+    # drives a blocking generator on one worker thread and holds the endpoint slot until
+    # that thread is done with it, even if the consumer goes away mid-stream
+    sem = _semaphore(endpoint)
+    await sem.acquire()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            gen = fn(*args, **kwargs)
+            try:
+                for item in gen:
+                    if stop.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+            finally:
+                gen.close()
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (done, e))
+            return
+        loop.call_soon_threadsafe(queue.put_nowait, (done, None))
+
+    try:
+        future = loop.run_in_executor(executor or io_executor, produce)
+    except Exception:
+        sem.release()
+        raise
+    future.add_done_callback(lambda _: sem.release())
+
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def shutdown_executors(wait=True):
+    io_executor.shutdown(wait=wait)
+    ingest_executor.shutdown(wait=wait)
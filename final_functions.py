@@ -1,51 +1,145 @@
 import os
 import tempfile
-from ocr_api_request import extract_text_from_pdf
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from ocr_api_request import iter_pdf_pages
 from emergency_tag_extractor import extract_metadata
-from fuzzy_metadata_search import input_metadata
+from fuzzy_metadata_search import claim_doc_id, index_claimed_metadata, delete_document_by_doc_id, INDEX
 from vectordb_functions import input_doc
+from ingestion_progress import IngestionProgress
+from answer_cache import answer_cache
+from opensearch_client import get_client
 
 
-def process_and_index_document(file, doc_id):
+METADATA_MAX_CHARS = int(os.getenv("DEEPRECALL_METADATA_MAX_CHARS", "20000"))
+PIPELINE_WORKERS = int(os.getenv("DEEPRECALL_PIPELINE_WORKERS", "4"))
+
+# runs the metadata branch while the calling thread embeds and bulk-indexes paragraphs
+_pipeline_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="deeprecall-pipeline")
+
+
+def count_pages(pages, progress):
+    for page in pages:
+        yield page
+        progress.add_pages()
+
+
+def iter_ocr_pages(file, progress, sources=None):
+    # page ranges are OCR'd in parallel and yielded in order, so indexing starts
+    # on the first range while later ones are still in flight; each OCR request is
+    # tracked on its own instead of the stage spanning the whole suspended stream
+    return iter_pdf_pages(file, sources=sources, track=progress.track)
+
+
+def sample_pages(pages, sample, ready, max_chars=METADATA_MAX_CHARS):
+    # copy the leading pages into the metadata sample as they stream past to the indexer
+    size = 0
     try:
-        print(f"Processing and indexing document {doc_id} from file {file}")
+        for page in pages:
+            if not ready.is_set():
+                sample.append(page)
+                size += len(page)
+                if size >= max_chars:
+                    ready.set()
+            yield page
+    finally:
+        ready.set()
 
-        ocr_op = extract_text_from_pdf(file)
-        doc_text = ocr_op["extracted_text"]
 
-        doc_metadata = extract_metadata(str(doc_text))
+def extract_and_index_metadata(doc_id, sample, ready, progress):
+    ready.wait()
+    with progress.track("metadata"):
+        doc_metadata = extract_metadata("\n".join(sample)[:METADATA_MAX_CHARS])
         doc_metadata["doc_id"] = doc_id
+        index_claimed_metadata(doc_metadata)
+    return doc_metadata
+
 
-        input_metadata([doc_metadata])
+def rollback_document(doc_id, vector_index="deeprecall-rc-vector"):
+    # only called by the run holding the doc_id claim, so everything under doc_id is its own
+    print(f"Rolling back partially indexed document {doc_id}")
+    try:
+        # delete_by_query only sees refreshed documents, and the paragraphs and metadata
+        # written moments before the failure usually are not yet
+        get_client().indices.refresh(index=f"{INDEX},{vector_index}", ignore_unavailable=True)
+        delete_document_by_doc_id(doc_id, metadata_index=INDEX, vector_index=vector_index, refresh=True)
+    except Exception as e:
+        print(f"Rollback failed for {doc_id}: {e}")
 
-        input_doc(
-            doc_id,
-            "deeprecall-rc-vector",
-            doc_text,
-            "all-MiniLM-L6-v2"
-        )
 
-        print(f"Document {doc_id} processed and indexed successfully.")
-        return {
-            "success": True,
-            "doc_id": doc_id,
-            "metadata": doc_metadata
-        }
+def process_and_index_document(file, doc_id, progress=None):
+    progress = progress or IngestionProgress(doc_id)
+    metadata_future = None
+    claimed = False
+    try:
+        print(f"Processing and indexing document {doc_id} from file {file}")
 
-    except ValueError as e:
-        if "already exist" in str(e):
+        # claimed before any paragraph is written: paragraph ids are deterministic, so a
+        # concurrent upload with the same doc_id would otherwise overwrite this one's
+        if not claim_doc_id(doc_id):
             print(f"Duplicate doc_id detected: {doc_id}")
             return {
                 "success": False,
                 "error": "DUPLICATE_DOC_ID",
-                "message": str(e),
+                "message": f"Duplicate doc_id(s) already exist in index '{INDEX}': {[doc_id]}",
                 "doc_id": doc_id
             }
-        else:
-            raise
+        claimed = True
+
+        sample = []
+        page_sources = []
+        ready = threading.Event()
+        pages = sample_pages(count_pages(iter_ocr_pages(file, progress, page_sources), progress), sample, ready)
+
+        metadata_future = _pipeline_executor.submit(extract_and_index_metadata, doc_id, sample, ready, progress)
+
+        try:
+            with progress.track("indexing"):
+                index_result = input_doc(
+                    doc_id,
+                    "deeprecall-rc-vector",
+                    pages,
+                    "all-MiniLM-L6-v2",
+                    on_indexed=progress.add_paragraphs
+                )
+        finally:
+            # unblock the metadata branch even if OCR or indexing failed before the sample filled
+            ready.set()
+
+        doc_metadata = metadata_future.result()
+
+        if not index_result["success"]:
+            rollback_document(doc_id)
+            return {
+                "success": False,
+                "error": "INDEXING_FAILED",
+                "message": f"{len(index_result['failed'])} paragraphs failed to index",
+                "doc_id": doc_id,
+                "failed": index_result["failed"]
+            }
+
+        # answers built from an earlier version of this doc_id are stale now
+        answer_cache.invalidate_doc(doc_id)
+        print(f"Document {doc_id} processed and indexed successfully.")
+        return {
+            "success": True,
+            "doc_id": doc_id,
+            "metadata": doc_metadata,
+            "paragraphs_indexed": index_result["indexed"],
+            "page_sources": page_sources
+        }
+
+    except ValueError:
+        if claimed:
+            _wait_quietly(metadata_future)
+            rollback_document(doc_id)
+        raise
 
     except Exception as e:
         print(f"Failed to process document {doc_id}: {e}")
+        if claimed:
+            _wait_quietly(metadata_future)
+            rollback_document(doc_id)
         return {
             "success": False,
             "error": "PROCESSING_FAILED",
@@ -54,6 +148,16 @@ def process_and_index_document(file, doc_id):
         }
 
 
+def _wait_quietly(future):
+    # let the metadata branch finish before rolling back, or it could write after the delete
+    if future is None:
+        return
+    try:
+        future.result()
+    except Exception:
+        pass
+
+
 # if __name__ == "__main__":
 #     sample_pdf_path = 'demo.pdf'
 #     sample_doc_id = 'doc_123'
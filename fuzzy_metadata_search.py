@@ -1,31 +1,18 @@
-from opensearchpy import OpenSearch, helpers
+import os
+import json
+import base64
+from opensearchpy import helpers
+from opensearchpy.exceptions import ConflictError
 from datetime import datetime
-import warnings
-from urllib3.exceptions import InsecureRequestWarning
-
-warnings.filterwarnings("ignore", category=InsecureRequestWarning)
-warnings.filterwarnings("ignore", message="Connecting to https://localhost:9200 using SSL with verify_certs=False is insecure.")
-
-client = OpenSearch(
-    hosts=[{"host": "localhost", "port": 9200}],
-    http_auth=("admin", "'Deeprecall@123'"),
-    use_ssl=True,
-    verify_certs=False
-)
-
-try:
-    info = client.info()
-    print(f"Connected to OpenSearch cluster: {info['cluster_name']}")
-except Exception as e:
-    print(f"Connection failed: {e}")
-    exit(1)
+from opensearch_client import get_client, replica_settings, routing_required
 
 INDEX = "deeprecall-rc-fuzzy"
+PIT_KEEP_ALIVE = os.getenv("DEEPRECALL_PIT_KEEP_ALIVE", "1m")
 
 settings = {
     "index": {
         "number_of_shards": 1,
-        "number_of_replicas": 0
+        **replica_settings()
     }
 }
 
@@ -49,32 +36,36 @@ mappings = {
     }
 }
 
+_index_ready = False
+
+
+def ensure_metadata_index(index_name=INDEX):
+    global _index_ready
+    if _index_ready and index_name == INDEX:
+        return
+
+    client = get_client()
+    if not client.indices.exists(index=index_name):
+        client.indices.create(index=index_name, body={"settings": settings, "mappings": mappings})
+        print(f"Created index: {index_name}")
+
+    if index_name == INDEX:
+        _index_ready = True
 
-if not client.indices.exists(index=INDEX):
-    client.indices.create(index=INDEX, body={"settings": settings, "mappings": mappings})
-    print(f"Created index: {INDEX}")
-else:
-    print(f"Index '{INDEX}' already exists.")
 
 def existing_doc_ids(index_name: str, doc_ids: list[str]) -> set[str]:
+    client = get_client()
     if not client.indices.exists(index=index_name):
         return set()
 
-    query = {
-        "size": len(doc_ids),
-        "_source": ["doc_id"],
-        "query": {
-            "terms": {
-                "doc_id": doc_ids
-            }
-        }
-    }
-
-    res = client.search(index=index_name, body=query)
-    return {hit["_source"]["doc_id"] for hit in res["hits"]["hits"]}
+    # metadata documents are stored with _id = doc_id; a realtime mget sees writes and
+    # deletes immediately, so duplicate detection does not depend on index refreshes
+    res = client.mget(index=index_name, body={"ids": doc_ids}, _source=False)
+    return {doc["_id"] for doc in res["docs"] if doc.get("found")}
 
 
 def input_metadata(docs: list[dict]):
+    client = get_client()
     if not docs:
         raise ValueError("No documents provided")
 
@@ -83,6 +74,7 @@ def input_metadata(docs: list[dict]):
     if len(incoming_ids) != len(docs):
         raise ValueError("Every document must contain a doc_id")
 
+    ensure_metadata_index()
     duplicates = existing_doc_ids(INDEX, incoming_ids)
     if duplicates:
         raise ValueError(
@@ -103,11 +95,41 @@ def input_metadata(docs: list[dict]):
     print(f"Indexed {len(actions)} documents successfully")
 
 
-def fuzzy_search(fv_dict, index=INDEX, k=5):
-    match_count = {}
+def claim_doc_id(doc_id: str, index_name=INDEX) -> bool:
+    # op_type=create fails with 409 if the _id exists, so of two concurrent uploads with
+    # the same doc_id exactly one gets the claim; the placeholder is replaced by the
+    # extracted metadata, or removed by the rollback
+    ensure_metadata_index(index_name)
+    try:
+        get_client().create(
+            index=index_name,
+            id=doc_id,
+            body={"doc_id": doc_id, "timestamp": datetime.utcnow()}
+        )
+    except ConflictError:
+        return False
+    return True
+
+
+def index_claimed_metadata(doc: dict, index_name=INDEX):
+    doc["timestamp"] = datetime.utcnow()
+    get_client().index(index=index_name, id=doc["doc_id"], body=doc)
+    print(f"Indexed metadata for {doc['doc_id']}")
 
+
+def fuzzy_match_counts(fv_dict, index=INDEX, per_field_hits=10):
+    client = get_client()
+    if not fv_dict:
+        return {}
+
+    # one _msearch carrying a sub-search per field keeps the per-field vote semantics
+    # while paying a single network round trip; only doc_id comes back in _source
+    searches = []
     for field, value in fv_dict.items():
-        query_body = {
+        searches.append({"index": index})
+        searches.append({
+            "size": per_field_hits,
+            "_source": ["doc_id"],
             "query": {
                 "match": {
                     field: {
@@ -118,61 +140,138 @@ def fuzzy_search(fv_dict, index=INDEX, k=5):
                     }
                 }
             }
-        }
+        })
 
-        res = client.search(index=index, body=query_body)
-        for hit in res["hits"]["hits"]:
+    res = client.msearch(body=searches)
+
+    match_count = {}
+    for field, sub in zip(fv_dict, res["responses"]):
+        if "error" in sub:
+            print(f"Fuzzy search failed for field '{field}': {sub['error']}")
+            continue
+
+        for hit in sub["hits"]["hits"]:
             doc_id = hit["_source"].get("doc_id", "unknown_id")
             match_count[doc_id] = match_count.get(doc_id, 0) + 1
 
+    return match_count
+
+
+def fuzzy_search(fv_dict, index=INDEX, k=5, with_counts=False):
+    match_count = fuzzy_match_counts(fv_dict, index)
+
     if not match_count:
         print("No matches found for any metadata fields.")
         return []
 
     sorted_match_count = sorted(match_count.items(), key=lambda x: x[1], reverse=True)
-    top_docs = [doc_id for doc_id, _ in sorted_match_count[:k]]
+    top = sorted_match_count[:k]
+    top_docs = [doc_id for doc_id, _ in top]
 
     print(f"Top {len(top_docs)} documents: {top_docs}")
+    if with_counts:
+        return [{"doc_id": doc_id, "fields_matched": count} for doc_id, count in top]
     return top_docs
 
 
-def view_all_entries(index=INDEX, batch_size=1000):
-    all_docs = []
+def encode_cursor(pit_id, search_after):
+    raw = json.dumps({"pit": pit_id, "after": search_after}).encode()
+    return base64.urlsafe_b64encode(raw).decode()
 
-    res = client.search(
-        index=index,
-        body={
-            "query": {"match_all": {}}
-        },
-        size=batch_size,
-        scroll="2m"
-    )
 
-    scroll_id = res["_scroll_id"]
+def decode_cursor(cursor):
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return state["pit"], state["after"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def open_pit(index=INDEX, keep_alive=PIT_KEEP_ALIVE):
+    # create_pit/delete_pit exist in both opensearch-py 2.x and 3.x; the older
+    # *_point_in_time methods were removed in 3.x
+    return get_client().create_pit(index=index, params={"keep_alive": keep_alive})["pit_id"]
+
+
+def _close_pit(pit_id):
+    try:
+        get_client().delete_pit(body={"pit_id": [pit_id]})
+    except Exception as e:
+        print(f"Failed to close point in time: {e}")
+
+
+def _pit_search(pit_id, size, fields=None, search_after=None, query=None, keep_alive=PIT_KEEP_ALIVE):
+    body = {
+        "size": size,
+        "pit": {"id": pit_id, "keep_alive": keep_alive},
+        # doc_id is the document _id, so it is a unique, stable sort key for search_after
+        "sort": [{"doc_id": "asc"}],
+        "track_total_hits": False,
+        "query": query or {"match_all": {}}
+    }
+    if fields:
+        body["_source"] = fields
+    if search_after:
+        body["search_after"] = search_after
+    return get_client().search(body=body)
+
+
+def list_entries_page(limit=100, cursor=None, fields=None, index=INDEX, keep_alive=PIT_KEEP_ALIVE):
+    if cursor:
+        pit_id, search_after = decode_cursor(cursor)
+    else:
+        pit_id = open_pit(index, keep_alive)
+        search_after = None
+
+    res = _pit_search(pit_id, limit, fields, search_after, keep_alive=keep_alive)
+    pit_id = res.get("pit_id", pit_id)
     hits = res["hits"]["hits"]
 
-    while hits:
-        for hit in hits:
-            all_docs.append(hit["_source"])
+    next_cursor = None
+    if len(hits) < limit:
+        _close_pit(pit_id)
+    else:
+        next_cursor = encode_cursor(pit_id, hits[-1]["sort"])
 
-        res = client.scroll(
-            scroll_id=scroll_id,
-            scroll="2m"
-        )
-        scroll_id = res["_scroll_id"]
-        hits = res["hits"]["hits"]
+    return {
+        "data": [hit["_source"] for hit in hits],
+        "next_cursor": next_cursor
+    }
 
-    client.clear_scroll(scroll_id=scroll_id)
-    return all_docs
 
-def view_doc_by_id(doc_id: str, index=INDEX):
+def iter_entries(index=INDEX, batch_size=1000, fields=None, query=None, keep_alive=PIT_KEEP_ALIVE):
+    pit_id = open_pit(index, keep_alive)
+    search_after = None
     try:
-        res = client.get(index=index, id=doc_id)
+        while True:
+            res = _pit_search(pit_id, batch_size, fields, search_after, query, keep_alive)
+            pit_id = res.get("pit_id", pit_id)
+            hits = res["hits"]["hits"]
+            for hit in hits:
+                yield hit["_source"]
+            if len(hits) < batch_size:
+                break
+            search_after = hits[-1]["sort"]
+    finally:
+        _close_pit(pit_id)
+
+
+def view_all_entries(index=INDEX, batch_size=1000, fields=None):
+    return list(iter_entries(index, batch_size, fields))
+
+def view_doc_by_id(doc_id: str, index=INDEX, fields=None):
+    client = get_client()
+    try:
+        if fields:
+            res = client.get(index=index, id=doc_id, _source_includes=fields)
+        else:
+            res = client.get(index=index, id=doc_id)
         return res["_source"]
     except Exception:
         return None
 
 def empty_index(index_name=INDEX):
+    client = get_client()
     if not client.indices.exists(index=index_name):
         return {
             "success": False,
@@ -201,8 +300,10 @@ def empty_index(index_name=INDEX):
 def delete_document_by_doc_id(
     doc_id: str,
     metadata_index="deeprecall-rc-fuzzy",
-    vector_index="deeprecall-rc-vector"
+    vector_index="deeprecall-rc-vector",
+    refresh=False
 ):
+    client = get_client()
     result = {
         "success": True,
         "doc_id": doc_id,
@@ -222,7 +323,7 @@ def delete_document_by_doc_id(
                     }
                 },
                 conflicts="proceed",
-                refresh=True
+                refresh=refresh
             )
             result["metadata_index"] = {
                 "deleted": res_meta.get("deleted", 0),
@@ -246,7 +347,9 @@ def delete_document_by_doc_id(
                     }
                 },
                 conflicts="proceed",
-                refresh=True
+                refresh=refresh,
+                # routed layout: all of the document's paragraphs live on one shard
+                routing=doc_id if routing_required(vector_index) else None
             )
             result["vector_index"] = {
                 "deleted": res_vec.get("deleted", 0),
@@ -266,6 +369,78 @@ def delete_document_by_doc_id(
     return result
 
 
+def delete_documents(
+    doc_ids: list[str],
+    metadata_index="deeprecall-rc-fuzzy",
+    vector_index="deeprecall-rc-vector",
+    refresh=False
+):
+    if not doc_ids:
+        raise ValueError("No doc_ids provided")
+
+    client = get_client()
+    result = {
+        "success": True,
+        "doc_ids": doc_ids,
+        "metadata_index": None,
+        "vector_index": None
+    }
+
+    # one terms delete per index, run server-side as a task; the caller polls the task ids
+    for key, index_name in (("metadata_index", metadata_index), ("vector_index", vector_index)):
+        try:
+            if not client.indices.exists(index=index_name):
+                result[key] = {
+                    "index": index_name,
+                    "task_id": None,
+                    "note": "index_not_found"
+                }
+                continue
+
+            routed = index_name == vector_index and routing_required(index_name)
+            res = client.delete_by_query(
+                index=index_name,
+                body={
+                    "query": {
+                        "terms": {
+                            "doc_id": doc_ids
+                        }
+                    }
+                },
+                conflicts="proceed",
+                refresh=refresh,
+                wait_for_completion=False,
+                slices="auto",
+                routing=",".join(doc_ids) if routed else None
+            )
+            result[key] = {
+                "index": index_name,
+                "task_id": res["task"]
+            }
+        except Exception as e:
+            result["success"] = False
+            result[key] = {
+                "index": index_name,
+                "task_id": None,
+                "error": str(e)
+            }
+
+    return result
+
+
+def get_task_status(task_id: str):
+    res = get_client().tasks.get(task_id=task_id)
+    response = res.get("response") or {}
+    return {
+        "task_id": task_id,
+        "completed": res.get("completed", False),
+        "status": res.get("task", {}).get("status"),
+        "deleted": response.get("deleted"),
+        "failures": response.get("failures", []),
+        "error": res.get("error")
+    }
+
+
 
 if __name__ == "__main__":
     # all_entries = view_all_entries()
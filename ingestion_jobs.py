@@ -0,0 +1,101 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from final_functions import process_and_index_document
+from ingestion_progress import IngestionProgress
+
+
+JOB_WORKERS = int(os.getenv("DEEPRECALL_JOB_WORKERS", "2"))
+JOB_QUEUE_MAX = int(os.getenv("DEEPRECALL_JOB_QUEUE_MAX", "100"))
+JOB_HISTORY_MAX = int(os.getenv("DEEPRECALL_JOB_HISTORY_MAX", "1000"))
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="deeprecall-job")
+# queued + running jobs; submissions beyond this are rejected instead of piling up files on disk
+_slots = threading.BoundedSemaphore(JOB_QUEUE_MAX)
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _evict_finished():
+    finished = [job_id for job_id, job in _jobs.items() if job["status"] in ("succeeded", "failed")]
+    while len(_jobs) > JOB_HISTORY_MAX and finished:
+        _jobs.pop(finished.pop(0), None)
+
+
+def submit_job(file_path, doc_id, cleanup=True):
+    if not _slots.acquire(blocking=False):
+        return None
+
+    job_id = uuid.uuid4().hex
+    job = {
+        "job_id": job_id,
+        "doc_id": doc_id,
+        "status": "queued",
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "progress": IngestionProgress(doc_id),
+        "result": None
+    }
+
+    with _jobs_lock:
+        _jobs[job_id] = job
+        _evict_finished()
+
+    _executor.submit(_run_job, job, file_path, cleanup)
+    print(f"Queued ingestion job {job_id} for document {doc_id}")
+    return job_id
+
+
+def _run_job(job, file_path, cleanup):
+    job["status"] = "running"
+    job["started_at"] = time.time()
+    try:
+        result = process_and_index_document(file_path, job["doc_id"], progress=job["progress"])
+        job["result"] = result
+        job["status"] = "succeeded" if result.get("success") else "failed"
+    except Exception as e:
+        job["result"] = {
+            "success": False,
+            "error": "PROCESSING_FAILED",
+            "message": str(e),
+            "doc_id": job["doc_id"]
+        }
+        job["status"] = "failed"
+    finally:
+        job["finished_at"] = time.time()
+        _slots.release()
+        if cleanup and os.path.exists(file_path):
+            try:
+                os.remove(file_path)
+            except Exception:
+                pass
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        return None
+
+    end = job["finished_at"] or time.time()
+    status = {
+        "job_id": job["job_id"],
+        "doc_id": job["doc_id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "queued_seconds": round((job["started_at"] or end) - job["created_at"], 3),
+        "elapsed_seconds": round(end - job["started_at"], 3) if job["started_at"] else None,
+        "result": job["result"]
+    }
+    status.update(job["progress"].snapshot())
+    return status
+
+
+def list_jobs(limit=100):
+    with _jobs_lock:
+        job_ids = list(_jobs)[-limit:]
+    return [get_job(job_id) for job_id in job_ids]
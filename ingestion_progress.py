@@ -0,0 +1,71 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+
+# max documents in each ingestion stage at once, across inline uploads and background jobs;
+# "ocr" counts OCR requests in flight, since a document's page ranges are tracked one by one
+STAGE_LIMITS = {
+    "ocr": int(os.getenv("DEEPRECALL_STAGE_LIMIT_OCR", "4")),
+    "metadata": int(os.getenv("DEEPRECALL_STAGE_LIMIT_METADATA", "4")),
+    "indexing": int(os.getenv("DEEPRECALL_STAGE_LIMIT_INDEXING", "2")),
+}
+
+_stage_semaphores = {stage: threading.BoundedSemaphore(limit) for stage, limit in STAGE_LIMITS.items()}
+
+
+class IngestionProgress:
+    def __init__(self, doc_id=None):
+        self.doc_id = doc_id
+        self.pages = 0
+        self.paragraphs = 0
+        self.active_stages = []
+        self.last_stage = None
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, stage):
+        sem = _stage_semaphores.get(stage)
+        queued_at = time.perf_counter()
+        if sem is not None:
+            sem.acquire()
+        started_at = time.perf_counter()
+
+        with self._lock:
+            self.active_stages.append(stage)
+            self.last_stage = stage
+        try:
+            yield self
+        finally:
+            if sem is not None:
+                sem.release()
+            with self._lock:
+                self.active_stages.remove(stage)
+                self.last_stage = stage
+                # a stage entered more than once (one OCR request per page range) sums its time
+                timing = self.timings.setdefault(stage, {"wait_seconds": 0.0, "seconds": 0.0, "calls": 0})
+                timing["wait_seconds"] = round(timing["wait_seconds"] + started_at - queued_at, 3)
+                timing["seconds"] = round(timing["seconds"] + time.perf_counter() - started_at, 3)
+                timing["calls"] += 1
+
+    def add_pages(self, n=1):
+        with self._lock:
+            self.pages += n
+
+    def add_paragraphs(self, n=1):
+        with self._lock:
+            self.paragraphs += n
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "stage": self.active_stages[-1] if self.active_stages else self.last_stage,
+                "active_stages": list(dict.fromkeys(self.active_stages)),
+                "progress": {
+                    "pages": self.pages,
+                    "paragraphs": self.paragraphs
+                },
+                "timings": {stage: dict(timing) for stage, timing in self.timings.items()}
+            }
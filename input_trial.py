@@ -1,26 +1,15 @@
-from opensearchpy import OpenSearch
 from opensearchpy.exceptions import RequestError
-from sentence_transformers import SentenceTransformer
+from embedding_models import get_model
+from opensearch_client import get_client, check_connection
 
 # Connect to OpenSearch
-client = OpenSearch(
-    hosts=[{'host': 'localhost', 'port': 9200}],
-    http_auth=("admin", "'Deeprecall@123'"),
-    use_ssl=True,
-    verify_certs=False
-)
-
-
-try:
-    info = client.info()
-    print("Connected to OpenSearch cluster:", info["cluster_name"])
-except Exception as e:
-    print("Connection failed:", e)
+client = get_client()
+if check_connection() is None:
     exit(1)
 
 
 # Load embedding model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+model = get_model('all-MiniLM-L6-v2')
 
 index_name = "vector-test"
 
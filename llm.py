@@ -1,24 +1,37 @@
+from typing import Optional
 from groq import Groq
+from conversation_memory import SessionStore, DEFAULT_SESSION
 
 client = Groq(api_key="")
 
-MESSAGE_HISTORY = []  # only stores the last 3 messages
+# per-session history, trimmed by token budget; holds queries and replies, never retrieval context
+SESSIONS = SessionStore()
 
-def chat_with_llm(user_query: str, retrieval_content: str) -> str:
-    global MESSAGE_HISTORY
+SYSTEM_PROMPT = (
+    "You are a helpful assistant. Use the given retrieval content to answer "
+    "the user's question accurately. If the information is not available in"
+    "the data given to you or you are unsure about it, only say you don't know"
+    "unless that information was given by the user themselves."
+)
+
+
+def _start_turn(session_id: Optional[str], user_query: str, retrieval_content: str) -> list:
+    # only the current turn carries retrieval context; without a session the call is stateless
+    current = {"role": "user", "content": f"Context:\n{retrieval_content}\n\nUser query: {user_query}"}
+    history = SESSIONS.history(session_id) if session_id else []
+
+    return [{"role": "system", "content": SYSTEM_PROMPT}] + history + [current]
 
-    system_prompt = (
-        "You are a helpful assistant. Use the given retrieval content to answer "
-        "the user's question accurately. If the information is not available in"
-        "the data given to you or you are unsure about it, only say you don't know"
-        "unless that information was given by the user themselves."
-    )
 
-    MESSAGE_HISTORY.append({"role": "user", "content": f"Context:\n{retrieval_content}\n\nUser query: {user_query}"})
+def record_turn(session_id: Optional[str], user_query: str, model_reply: str):
+    if not session_id:
+        return
+    SESSIONS.add_turn(session_id, "user", user_query)
+    SESSIONS.add_turn(session_id, "assistant", model_reply)
 
-    MESSAGE_HISTORY = MESSAGE_HISTORY[-3:]
 
-    messages = [{"role": "system", "content": system_prompt}] + MESSAGE_HISTORY
+def chat_with_llm(user_query: str, retrieval_content: str, session_id: Optional[str] = None) -> str:
+    messages = _start_turn(session_id, user_query, retrieval_content)
 
     response = client.chat.completions.create(
         model="llama-3.1-8b-instant",
@@ -29,11 +42,33 @@ def chat_with_llm(user_query: str, retrieval_content: str) -> str:
 
     model_reply = response.choices[0].message.content.strip()
 
-    MESSAGE_HISTORY.append({"role": "assistant", "content": model_reply})
-    MESSAGE_HISTORY = MESSAGE_HISTORY[-6:]
+    record_turn(session_id, user_query, model_reply)
 
     return model_reply
 
+
+def chat_with_llm_stream(user_query: str, retrieval_content: str, session_id: Optional[str] = None):
+    messages = _start_turn(session_id, user_query, retrieval_content)
+
+    stream = client.chat.completions.create(
+        model="llama-3.1-8b-instant",
+        messages=messages,
+        temperature=0.2,
+        max_tokens=1000,
+        stream=True,
+    )
+
+    parts = []
+    try:
+        for chunk in stream:
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if token:
+                parts.append(token)
+                yield token
+    finally:
+        # record whatever was generated, even if the client disconnected mid-stream
+        record_turn(session_id, user_query, "".join(parts).strip())
+
 if __name__ == "__main__":
     retrieval_content = (
         "The Chernobyl disaster was a catastrophic nuclear accident that occurred on April 26, 1986, "
@@ -51,5 +86,5 @@ if __name__ == "__main__":
             print("exiting")
             break
 
-        answer = chat_with_llm(user_query, retrieval_content)
+        answer = chat_with_llm(user_query, retrieval_content, DEFAULT_SESSION)
         print(f"\nAnswer: {answer}\n{'-'*60}\n")
@@ -0,0 +1,168 @@
+import io
+import csv
+import sys
+import argparse
+from fuzzy_metadata_search import iter_entries, mappings, INDEX
+
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+DEFAULT_FIELDS = list(mappings["properties"])
+
+
+def export_query(doc_ids=None, start=None, end=None):
+    filters = []
+    if doc_ids:
+        filters.append({"terms": {"doc_id": doc_ids}})
+    if start or end:
+        bounds = {}
+        if start:
+            bounds["gte"] = start
+        if end:
+            bounds["lte"] = end
+        filters.append({"range": {"timestamp": bounds}})
+
+    if not filters:
+        return {"match_all": {}}
+    return {"bool": {"filter": filters}}
+
+
+def _flatten(value):
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return ", ".join(map(str, value))
+    return str(value)
+
+
+def iter_record_batches(fields=None, doc_ids=None, start=None, end=None, batch_size=EXPORT_BATCH_SIZE, index=INDEX):
+    fields = fields or DEFAULT_FIELDS
+    batch = []
+    for doc in iter_entries(index=index, batch_size=batch_size, fields=fields, query=export_query(doc_ids, start, end)):
+        batch.append({field: _flatten(doc.get(field)) for field in fields})
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_csv(batches, fields):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(fields)
+    for batch in batches:
+        for record in batch:
+            writer.writerow(["" if record[field] is None else record[field] for field in fields])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    # write-only file object that hands back what was written so far, while keeping
+    # tell() monotonic for writers that record byte offsets (parquet footers)
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _arrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("pyarrow is required for parquet/arrow export: pip install pyarrow")
+    return pa, pq
+
+
+def iter_columnar(batches, fields, fmt="parquet"):
+    pa, pq = _arrow()
+    schema = pa.schema([(field, pa.string()) for field in fields])
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+        write = writer.write_table
+        to_table = lambda batch: pa.Table.from_pylist(batch, schema=schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+        write = writer.write_batch
+        to_table = lambda batch: pa.RecordBatch.from_pylist(batch, schema=schema)
+
+    try:
+        for batch in batches:
+            # one row group / record batch per fetched page, flushed straight to the caller
+            write(to_table(batch))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def iter_export(fmt="csv", fields=None, doc_ids=None, start=None, end=None, batch_size=EXPORT_BATCH_SIZE):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    fields = fields or DEFAULT_FIELDS
+    if fmt != "csv":
+        # fail before the first OpenSearch round trip if pyarrow is missing
+        _arrow()
+
+    batches = iter_record_batches(fields, doc_ids, start, end, batch_size)
+    if fmt == "csv":
+        return iter_csv(batches, fields)
+    return iter_columnar(batches, fields, fmt)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export document metadata from deeprecall-rc-fuzzy")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--output", "-o", help="output file (defaults to stdout)")
+    parser.add_argument("--fields", help="comma-separated fields to export")
+    parser.add_argument("--doc-ids", help="comma-separated doc_ids to export")
+    parser.add_argument("--start", help="only documents with timestamp >= this date")
+    parser.add_argument("--end", help="only documents with timestamp <= this date")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    chunks = iter_export(
+        args.format,
+        fields=args.fields.split(",") if args.fields else None,
+        doc_ids=args.doc_ids.split(",") if args.doc_ids else None,
+        start=args.start,
+        end=args.end,
+        batch_size=args.batch_size
+    )
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            out.write(chunk.encode() if isinstance(chunk, str) else chunk)
+    finally:
+        if args.output:
+            out.close()
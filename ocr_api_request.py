@@ -1,12 +1,230 @@
+import io
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from pypdf import PdfReader, PdfWriter
+from pypdf.errors import PyPdfError
+import ocr_cache
 
-def extract_text_from_pdf(pdf_path):
-    url = "https://62a34d3465520.notebooks.jarvislabs.net/proxy/8000/extract_text" 
-    with open(pdf_path, "rb") as f:
-        files = {"file": (pdf_path, f, "application/pdf")}
-        response = requests.post(url, files=files)
+
+OCR_URL = os.getenv("DEEPRECALL_OCR_URL", "https://62a34d3465520.notebooks.jarvislabs.net/proxy/8000/extract_text")
+OCR_PAGES_PER_REQUEST = int(os.getenv("DEEPRECALL_OCR_PAGES_PER_REQUEST", "10"))
+OCR_PARALLELISM = int(os.getenv("DEEPRECALL_OCR_PARALLELISM", "4"))
+OCR_CONNECT_TIMEOUT = float(os.getenv("DEEPRECALL_OCR_CONNECT_TIMEOUT", "10"))
+OCR_READ_TIMEOUT = float(os.getenv("DEEPRECALL_OCR_READ_TIMEOUT", "300"))
+OCR_MAX_RETRIES = int(os.getenv("DEEPRECALL_OCR_MAX_RETRIES", "4"))
+OCR_BACKOFF_FACTOR = float(os.getenv("DEEPRECALL_OCR_BACKOFF_FACTOR", "1.0"))
+
+# born-digital pages with at least this much extractable text skip the OCR service
+USE_TEXT_LAYER = os.getenv("DEEPRECALL_USE_TEXT_LAYER", "1") == "1"
+TEXT_LAYER_MIN_CHARS = int(os.getenv("DEEPRECALL_TEXT_LAYER_MIN_CHARS", "50"))
+
+_session = None
+_session_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=OCR_PARALLELISM, thread_name_prefix="deeprecall-ocr")
+
+
+def get_session():
+    global _session
+    if _session is not None:
+        return _session
+
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=OCR_MAX_RETRIES,
+                backoff_factor=OCR_BACKOFF_FACTOR,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(["POST"]),
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=OCR_PARALLELISM, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def ocr_request(filename, pdf_bytes, expected_pages=None):
+    files = {"file": (filename, pdf_bytes, "application/pdf")}
+    response = get_session().post(OCR_URL, files=files, timeout=(OCR_CONNECT_TIMEOUT, OCR_READ_TIMEOUT))
     response.raise_for_status()
-    return response.json()
+    pages = response.json()["extracted_text"]
+    # page numbers, and so paragraph ids, come from position; a short or long reply
+    # would silently shift every later page
+    if expected_pages is not None and len(pages) != expected_pages:
+        raise ValueError(f"OCR returned {len(pages)} pages for {filename}, expected {expected_pages}")
+    return pages
+
+
+def pdf_bytes(reader, page_numbers):
+    writer = PdfWriter()
+    for page_no in page_numbers:
+        writer.add_page(reader.pages[page_no])
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+
+def page_text_layer(page, min_chars=TEXT_LAYER_MIN_CHARS):
+    try:
+        text = page.extract_text() or ""
+    except Exception:
+        return None
+    # scanned pages often carry a few stray glyphs; treat those as image-only
+    return text if len(text.strip()) >= min_chars else None
+
+
+def open_reader(pdf_path):
+    # None when pypdf cannot read the file (malformed, encrypted, non-standard); the
+    # OCR service may still manage it, as it did before pages were split locally
+    try:
+        reader = PdfReader(pdf_path)
+        if reader.is_encrypted:
+            # many protected PDFs only carry an owner password and open with an empty one
+            reader.decrypt("")
+        len(reader.pages)
+        return reader
+    except PyPdfError as e:
+        print(f"pypdf cannot read {pdf_path}: {e}")
+        return None
+
+
+def plan_segments(reader, pages_per_chunk=OCR_PAGES_PER_REQUEST, use_text_layer=True):
+    # lazy: pages are classified only as the caller's look-ahead window advances
+    pending = []
+    for page_no, page in enumerate(reader.pages):
+        text = page_text_layer(page) if use_text_layer else None
+        if text is None:
+            pending.append(page_no)
+            if len(pending) >= pages_per_chunk:
+                yield "ocr", pending
+                pending = []
+            continue
+
+        if pending:
+            yield "ocr", pending
+            pending = []
+        yield "text_layer", text
+
+    if pending:
+        yield "ocr", pending
+
+
+def iter_classified_pages(
+    pdf_path,
+    pages_per_chunk=OCR_PAGES_PER_REQUEST,
+    parallelism=OCR_PARALLELISM,
+    use_text_layer=USE_TEXT_LAYER,
+    track=None
+):
+    def run_ocr(filename, data, expected_pages=None):
+        # track("ocr") wraps only the request itself, so the stage limit and timings
+        # cover OCR work rather than the whole time the page stream is open
+        if track is None:
+            return ocr_request(filename, data, expected_pages)
+        with track("ocr"):
+            return ocr_request(filename, data, expected_pages)
+
+    name = os.path.basename(pdf_path)
+    stem = os.path.splitext(name)[0]
+    reader = open_reader(pdf_path)
+    if reader is None:
+        with open(pdf_path, "rb") as f:
+            data = f.read()
+        for page in run_ocr(name, data):
+            yield page, "ocr"
+        return
+
+    segments = plan_segments(reader, pages_per_chunk, use_text_layer)
+
+    # keep at most `parallelism` segments planned ahead of the cursor, with their OCR
+    # ranges in flight, and yield every page back in document order
+    window = deque()
+
+    def fill():
+        while len(window) < parallelism:
+            segment = next(segments, None)
+            if segment is None:
+                return
+            kind, payload = segment
+            if kind == "ocr":
+                payload = _executor.submit(
+                    run_ocr, f"{stem}_p{payload[0] + 1}.pdf", pdf_bytes(reader, payload), len(payload)
+                )
+            window.append((kind, payload))
+
+    fill()
+    while window:
+        kind, payload = window.popleft()
+        fill()
+        if kind == "text_layer":
+            yield payload, "text_layer"
+        else:
+            for page in payload.result():
+                yield page, "ocr"
+
+
+def iter_pdf_pages(pdf_path, use_cache=True, sources=None, track=None):
+    key = ocr_cache.file_cache_key(pdf_path) if use_cache else None
+    if key:
+        cached = ocr_cache.get(key)
+        if cached is not None:
+            print(f"OCR cache hit for {pdf_path}")
+            for page, source in cached:
+                if sources is not None:
+                    sources.append(source)
+                yield page
+            return
+
+    # pages go to the cache entry as they are extracted, so memory stays bounded by the
+    # OCR look-ahead window rather than the document length
+    writer = None
+    if key:
+        try:
+            writer = ocr_cache.EntryWriter(key)
+        except OSError as e:
+            print(f"Failed to cache OCR result for {pdf_path}: {e}")
+
+    counts = {"text_layer": 0, "ocr": 0}
+    completed = False
+    try:
+        for page, source in iter_classified_pages(pdf_path, track=track):
+            counts[source] += 1
+            if sources is not None:
+                sources.append(source)
+            if writer is not None:
+                try:
+                    writer.write(page, source)
+                except OSError as e:
+                    print(f"Failed to cache OCR result for {pdf_path}: {e}")
+                    writer.abort()
+                    writer = None
+            yield page
+        completed = True
+    finally:
+        if writer is not None:
+            if completed:
+                try:
+                    writer.commit()
+                except OSError as e:
+                    print(f"Failed to cache OCR result for {pdf_path}: {e}")
+                    writer.abort()
+            else:
+                writer.abort()
+
+    print(f"Extracted {counts['text_layer']} pages locally, {counts['ocr']} via OCR")
+
+
+def extract_text_from_pdf(pdf_path, use_cache=True):
+    sources = []
+    pages = list(iter_pdf_pages(pdf_path, use_cache, sources))
+    return {"extracted_text": pages, "page_sources": sources}
 
 if __name__ == "__main__":
     result = extract_text_from_pdf("/home/adi/files/deeprecall/demo.pdf")
@@ -0,0 +1,197 @@
+import os
+import json
+import hashlib
+import argparse
+import tempfile
+import threading
+
+
+OCR_CACHE_DIR = os.getenv("DEEPRECALL_OCR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "deeprecall", "ocr"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("DEEPRECALL_OCR_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# bump when the OCR service or model changes so old results are not reused
+OCR_SERVICE_VERSION = os.getenv("DEEPRECALL_OCR_SERVICE_VERSION", "v1")
+# text-layer extraction and OCR produce different text, so the policy (and the threshold
+# that decides which pages use the text layer) is part of the key
+CACHE_VERSION = (
+    f"{OCR_SERVICE_VERSION}"
+    f"+text_layer={os.getenv('DEEPRECALL_USE_TEXT_LAYER', '1')}"
+    f"+min_chars={os.getenv('DEEPRECALL_TEXT_LAYER_MIN_CHARS', '50')}"
+)
+
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+_lock = threading.Lock()
+
+
+def file_cache_key(pdf_path, version=CACHE_VERSION):
+    digest = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    digest.update(f"|ocr:{version}".encode())
+    return digest.hexdigest()
+
+
+def _entry_path(key, cache_dir=OCR_CACHE_DIR):
+    # two-level fan-out keeps directories small on large caches; one JSON line per page
+    return os.path.join(cache_dir, key[:2], f"{key}.jsonl")
+
+
+def _iter_lines(f):
+    with f:
+        for line in f:
+            record = json.loads(line)
+            yield record["text"], record["source"]
+
+
+def get(key, cache_dir=OCR_CACHE_DIR):
+    # returns a lazy (text, source) page iterator, or None on a miss
+    path = _entry_path(key, cache_dir)
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except OSError:
+        with _lock:
+            _stats["misses"] += 1
+        return None
+
+    # mtime doubles as the LRU clock for eviction
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    with _lock:
+        _stats["hits"] += 1
+    return _iter_lines(f)
+
+
+class EntryWriter:
+    # appends pages to a temp file as they are extracted and publishes the entry only
+    # once the whole document is in, so readers never see a partial result
+    def __init__(self, key, cache_dir=OCR_CACHE_DIR, max_bytes=OCR_CACHE_MAX_BYTES):
+        self.path = _entry_path(key, cache_dir)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+        self._file = os.fdopen(fd, "w", encoding="utf-8")
+
+    def write(self, text, source="ocr"):
+        self._file.write(json.dumps({"text": text, "source": source}, ensure_ascii=False))
+        self._file.write("\n")
+
+    def commit(self):
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+        with _lock:
+            _stats["writes"] += 1
+        evict(self.cache_dir, self.max_bytes)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def put(key, result, cache_dir=OCR_CACHE_DIR, max_bytes=OCR_CACHE_MAX_BYTES):
+    pages = result["extracted_text"]
+    sources = result.get("page_sources") or ["ocr"] * len(pages)
+    writer = EntryWriter(key, cache_dir, max_bytes)
+    try:
+        for text, source in zip(pages, sources):
+            writer.write(text, source)
+        writer.commit()
+    except Exception:
+        writer.abort()
+        raise
+
+
+def _entries(cache_dir=OCR_CACHE_DIR):
+    entries = []
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            # .json files are whole-document entries from before the per-page format
+            if not name.endswith((".jsonl", ".json")):
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+    return entries
+
+
+def evict(cache_dir=OCR_CACHE_DIR, max_bytes=OCR_CACHE_MAX_BYTES):
+    entries = _entries(cache_dir)
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+
+    with _lock:
+        _stats["evictions"] += removed
+    return removed
+
+
+def seed(pdf_path, result, cache_dir=OCR_CACHE_DIR):
+    if "extracted_text" not in result:
+        raise ValueError("OCR result must contain 'extracted_text'")
+    key = file_cache_key(pdf_path)
+    put(key, result, cache_dir)
+    return key
+
+
+def clear(cache_dir=OCR_CACHE_DIR):
+    removed = 0
+    for _, _, path in _entries(cache_dir):
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def cache_stats(cache_dir=OCR_CACHE_DIR):
+    entries = _entries(cache_dir)
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats.update({
+        "hit_rate": round(stats["hits"] / lookups, 3) if lookups else None,
+        "entries": len(entries),
+        "bytes": sum(size for _, size, _ in entries),
+        "max_bytes": OCR_CACHE_MAX_BYTES,
+        "cache_dir": cache_dir,
+        "cache_version": CACHE_VERSION
+    })
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the on-disk OCR result cache")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats")
+    sub.add_parser("clear")
+    seed_parser = sub.add_parser("seed")
+    seed_parser.add_argument("pdf_path")
+    seed_parser.add_argument("result_json", help="JSON file with an 'extracted_text' page list")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        print(json.dumps(cache_stats(), indent=2))
+    elif args.command == "clear":
+        print(f"Removed {clear()} cached OCR results")
+    else:
+        with open(args.result_json, "r", encoding="utf-8") as f:
+            print(f"Seeded {seed(args.pdf_path, json.load(f))}")
@@ -0,0 +1,161 @@
+import os
+import time
+import threading
+import warnings
+from opensearchpy import OpenSearch
+from opensearchpy.connection_pool import RoundRobinSelector
+from urllib3.exceptions import InsecureRequestWarning
+
+warnings.filterwarnings("ignore", category=InsecureRequestWarning)
+warnings.filterwarnings("ignore", message=".*using SSL with verify_certs=False is insecure.")
+
+# comma separated host:port list, one entry per node, e.g. "localhost:9200,localhost:9201"
+OPENSEARCH_HOSTS = os.getenv("OPENSEARCH_HOSTS", "localhost:9200,localhost:9201")
+OPENSEARCH_USER = os.getenv("OPENSEARCH_USER", "admin")
+OPENSEARCH_PASSWORD = os.getenv("OPENSEARCH_PASSWORD", "'Deeprecall@123'")
+
+OPENSEARCH_POOL_MAXSIZE = int(os.getenv("OPENSEARCH_POOL_MAXSIZE", "25"))
+OPENSEARCH_TIMEOUT = float(os.getenv("OPENSEARCH_TIMEOUT", "30"))
+OPENSEARCH_MAX_RETRIES = int(os.getenv("OPENSEARCH_MAX_RETRIES", "3"))
+OPENSEARCH_HTTP_COMPRESS = os.getenv("OPENSEARCH_HTTP_COMPRESS", "1") == "1"
+
+# seconds a failed node is kept out of rotation; doubles on repeated failures
+OPENSEARCH_DEAD_TIMEOUT = float(os.getenv("OPENSEARCH_DEAD_TIMEOUT", "30"))
+# sniffing replaces the configured hosts with the addresses nodes publish, which are
+# only reachable from inside the docker network, so it is off by default
+OPENSEARCH_SNIFF = os.getenv("OPENSEARCH_SNIFF", "0") == "1"
+OPENSEARCH_SNIFFER_TIMEOUT = float(os.getenv("OPENSEARCH_SNIFFER_TIMEOUT", "60"))
+
+OPENSEARCH_NUMBER_OF_REPLICAS = os.getenv("OPENSEARCH_NUMBER_OF_REPLICAS")
+OPENSEARCH_AUTO_EXPAND_REPLICAS = os.getenv("OPENSEARCH_AUTO_EXPAND_REPLICAS", "0-all")
+# seconds an "unrouted" answer is trusted before the mapping is checked again
+ROUTING_RECHECK_SECONDS = float(os.getenv("OPENSEARCH_ROUTING_RECHECK_SECONDS", "30"))
+
+_client = None
+_client_lock = threading.Lock()
+_routed_indices = set()
+_unrouted_checked = {}
+
+
+def parse_hosts(hosts=OPENSEARCH_HOSTS):
+    parsed = []
+    for entry in hosts.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, _, port = entry.partition(":")
+        parsed.append({"host": host, "port": int(port or 9200)})
+    return parsed
+
+
+def client_settings():
+    settings = {
+        "hosts": parse_hosts(),
+        "http_auth": (OPENSEARCH_USER, OPENSEARCH_PASSWORD),
+        "use_ssl": True,
+        "verify_certs": False,
+        "ssl_show_warn": False,
+        # urllib3 keeps up to pool_maxsize connections alive per node for reuse
+        "pool_maxsize": OPENSEARCH_POOL_MAXSIZE,
+        "headers": {"Connection": "keep-alive"},
+        "timeout": OPENSEARCH_TIMEOUT,
+        "max_retries": OPENSEARCH_MAX_RETRIES,
+        "retry_on_timeout": True,
+        "http_compress": OPENSEARCH_HTTP_COMPRESS,
+        "selector_class": RoundRobinSelector,
+        "randomize_hosts": True,
+        "dead_timeout": OPENSEARCH_DEAD_TIMEOUT
+    }
+
+    if OPENSEARCH_SNIFF:
+        settings.update({
+            "sniff_on_start": True,
+            "sniff_on_connection_fail": True,
+            "sniffer_timeout": OPENSEARCH_SNIFFER_TIMEOUT
+        })
+    return settings
+
+
+def replica_settings():
+    if OPENSEARCH_NUMBER_OF_REPLICAS is not None:
+        return {"number_of_replicas": int(OPENSEARCH_NUMBER_OF_REPLICAS)}
+    # one copy per data node, so every node can serve reads and a single node still goes green
+    return {"auto_expand_replicas": OPENSEARCH_AUTO_EXPAND_REPLICAS}
+
+
+def apply_replica_settings(index_name):
+    client = get_client()
+    if not client.indices.exists(index=index_name):
+        return None
+    return client.indices.put_settings(index=index_name, body={"index": replica_settings()})
+
+
+def routing_required(index_name):
+    # indices created before the routed layout keep default hashing on _id and must be
+    # searched without a routing value. A positive answer is cached for good; a negative
+    # one only briefly, since a migration run from another process can turn the name into
+    # a routed alias at any time.
+    if index_name in _routed_indices:
+        return True
+    checked = _unrouted_checked.get(index_name)
+    if checked is not None and time.monotonic() - checked < ROUTING_RECHECK_SECONDS:
+        return False
+
+    client = get_client()
+    if not client.indices.exists(index=index_name):
+        return False
+    mappings = client.indices.get_mapping(index=index_name)
+    required = bool(mappings) and all(
+        index["mappings"].get("_routing", {}).get("required", False)
+        for index in mappings.values()
+    )
+    if required:
+        _routed_indices.add(index_name)
+    else:
+        _unrouted_checked[index_name] = time.monotonic()
+    return required
+
+
+def forget_routing(index_name=None):
+    if index_name is None:
+        _routed_indices.clear()
+        _unrouted_checked.clear()
+    else:
+        _routed_indices.discard(index_name)
+        _unrouted_checked.pop(index_name, None)
+
+
+def get_client():
+    global _client
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            _client = OpenSearch(**client_settings())
+        return _client
+
+
+def check_connection():
+    try:
+        info = get_client().info()
+        print(f"Connected to OpenSearch cluster: {info['cluster_name']}")
+        return info
+    except Exception as e:
+        print(f"Connection failed: {e}")
+        return None
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+if __name__ == "__main__":
+    # bring indices created with number_of_replicas: 0 in line with the current node count
+    if check_connection() is not None:
+        for index_name in ("deeprecall-rc-fuzzy", "deeprecall-rc-vector"):
+            print(index_name, apply_replica_settings(index_name))
@@ -0,0 +1,153 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("DEEPRECALL_QUERY_CACHE_MAX_ENTRIES", "2048"))
+QUERY_CACHE_TTL = float(os.getenv("DEEPRECALL_QUERY_CACHE_TTL", "3600"))
+# optional sqlite file shared by every worker process on the host
+QUERY_CACHE_DB = os.getenv("DEEPRECALL_QUERY_CACHE_DB")
+QUERY_CACHE_DB_MAX_ENTRIES = int(os.getenv("DEEPRECALL_QUERY_CACHE_DB_MAX_ENTRIES", "50000"))
+# expired and surplus rows are deleted once every this many writes per process
+QUERY_CACHE_DB_PRUNE_EVERY = int(os.getenv("DEEPRECALL_QUERY_CACHE_DB_PRUNE_EVERY", "64"))
+
+
+def normalise_query(text):
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.strip(" ?!.,;:")
+
+
+class SqliteStore:
+    def __init__(self, path, ttl, max_entries=QUERY_CACHE_DB_MAX_ENTRIES, prune_every=QUERY_CACHE_DB_PRUNE_EVERY):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prune_every = max(1, prune_every)
+        self._local = threading.local()
+        self._puts = 0
+        self._puts_lock = threading.Lock()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_cache (key TEXT PRIMARY KEY, value TEXT, stored_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS query_cache_stored_at ON query_cache (stored_at)")
+            self._prune(conn)
+
+    def _conn(self):
+        # sqlite connections are not shareable across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value, stored_at FROM query_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO query_cache (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time())
+            )
+            with self._puts_lock:
+                self._puts += 1
+                due = self._puts % self.prune_every == 0
+            if due:
+                self._prune(conn)
+
+    def _prune(self, conn):
+        conn.execute("DELETE FROM query_cache WHERE stored_at < ?", (time.time() - self.ttl,))
+        # keep only the newest rows once the shared file outgrows its cap
+        conn.execute(
+            "DELETE FROM query_cache WHERE key IN "
+            "(SELECT key FROM query_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM query_cache")
+
+
+class LRUTTLCache:
+    def __init__(self, max_entries=QUERY_CACHE_MAX_ENTRIES, ttl=QUERY_CACHE_TTL, store=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "store_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._entries[key]
+                self._stats["expirations"] += 1
+
+        if self.store is not None:
+            try:
+                value = self.store.get(key)
+            except sqlite3.Error as e:
+                print(f"Query cache store read failed: {e}")
+                value = None
+            if value is not None:
+                self._remember(key, value)
+                with self._lock:
+                    self._stats["store_hits"] += 1
+                return value
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.store is not None:
+            try:
+                self.store.put(key, value)
+            except sqlite3.Error as e:
+                print(f"Query cache store write failed: {e}")
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["store_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["store_hits"]) / lookups, 3) if lookups else None
+        stats["max_entries"] = self.max_entries
+        stats["ttl_seconds"] = self.ttl
+        return stats
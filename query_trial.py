@@ -1,12 +1,7 @@
-from opensearchpy import OpenSearch
+from opensearch_client import get_client
 
 # Connect to OpenSearch
-client = OpenSearch(
-    hosts=[{'host': 'localhost', 'port': 9200}],
-    http_auth=("admin", "'Deeprecall@123'"),
-    use_ssl=True,
-    verify_certs=False
-)
+client = get_client()
 
 query_text = "which reactor exploded"
 
@@ -1,10 +1,20 @@
 from groq import Groq
 import json
+import copy
 from fuzzy_metadata_search import fuzzy_search
-from vectordb_functions import get_paras
+import os
+from vectordb_functions import get_paras, PARAS_PER_DOC
+from context_builder import build_context, CONTEXT_CANDIDATES, CONTEXT_TOKEN_BUDGET
+from query_cache import LRUTTLCache, SqliteStore, normalise_query, QUERY_CACHE_DB, QUERY_CACHE_TTL
 
 client = Groq(api_key="GROQ")
 
+# paragraph scores of the i-th ranked fuzzy match are scaled by max(1 - i * decay, floor)
+FUZZY_RANK_DECAY = float(os.getenv("DEEPRECALL_FUZZY_RANK_DECAY", "0.15"))
+FUZZY_RANK_FLOOR = float(os.getenv("DEEPRECALL_FUZZY_RANK_FLOOR", "0.25"))
+
+query_metadata_cache = LRUTTLCache(store=SqliteStore(QUERY_CACHE_DB, QUERY_CACHE_TTL) if QUERY_CACHE_DB else None)
+
 def extract_from_query(input_query: str) -> dict : 
     messages = [
         {
@@ -58,6 +68,16 @@ def extract_from_query(input_query: str) -> dict :
     cont = response.choices[0].message.content
     return json.loads(cont)
 
+def extract_from_query_cached(input_query: str) -> dict:
+    key = normalise_query(input_query)
+    cached = query_metadata_cache.get(key)
+    if cached is None:
+        cached = extract_from_query(input_query)
+        query_metadata_cache.put(key, cached)
+    # callers may mutate the dict, so never hand out the cached instance
+    return copy.deepcopy(cached)
+
+
 def get_fvdict(raw_metadata):
     fv_dict = {}
     for key, value in raw_metadata.items():
@@ -68,23 +88,43 @@ def get_fvdict(raw_metadata):
     
     return fv_dict
 
-def final_paras(query,doc_id,index_name="deeprecall-rc-vector"):
-    top_paras = get_paras(index_name,doc_id,query)
-    final_content = ''
-    for hit in top_paras["hits"]["hits"]:
-        src = hit["_source"]
-        #print(f"{src['text']}")
-        final_content+=f"{src['text']}"
-    return final_content
+def rank_weights(doc_ids, decay=FUZZY_RANK_DECAY, floor=FUZZY_RANK_FLOOR):
+    return {doc_id: max(1.0 - rank * decay, floor) for rank, doc_id in enumerate(doc_ids)}
+
+
+def final_passages(query,doc_ids,index_name="deeprecall-rc-vector",k=CONTEXT_CANDIDATES,token_budget=CONTEXT_TOKEN_BUDGET,per_doc=PARAS_PER_DOC,weighted=True):
+    if isinstance(doc_ids, str):
+        doc_ids = [doc_ids]
+    top_paras = get_paras(
+        index_name,
+        doc_ids,
+        query,
+        k=k,
+        per_doc=per_doc,
+        doc_weights=rank_weights(doc_ids) if weighted and len(doc_ids) > 1 else None
+    )
+    return build_context(top_paras["hits"]["hits"], token_budget)
+
+
+def final_paras(query,doc_ids,index_name="deeprecall-rc-vector",k=CONTEXT_CANDIDATES,token_budget=CONTEXT_TOKEN_BUDGET):
+    return final_passages(query,doc_ids,index_name,k,token_budget)["context"]
+
+
+def retrieve_with_sources(text):
+    fv_dict=get_fvdict(extract_from_query_cached(text))
+    print(fv_dict)
+    doc_ids = fuzzy_search(fv_dict)
+    if not doc_ids:
+        return "", []
+    built = final_passages(text,doc_ids)
+    sources = list(dict.fromkeys(p["doc_id"] for p in built["passages"]))
+    return built["context"], sources
 
 
 def retrieve(text):
     # raw_metadata = extract_from_query(text)
     print("hello i am here")
-    fv_dict=get_fvdict(extract_from_query(text))
-    print(fv_dict)
-    doc_ids = fuzzy_search(fv_dict)
-    contn = final_paras(text,doc_ids[0])
+    contn, _ = retrieve_with_sources(text)
     return contn
 
 
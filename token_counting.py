@@ -0,0 +1,44 @@
+import os
+import threading
+from embedding_models import get_model, DEFAULT_EMB_MODEL
+
+
+# HF tokenizer to count prompt tokens with; defaults to the already-loaded embedding
+# model's tokenizer so no extra download is needed. Point it at the chat model's
+# tokenizer for exact budgets.
+TOKENIZER_NAME = os.getenv("DEEPRECALL_TOKENIZER")
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is not None:
+        return _tokenizer
+
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            if TOKENIZER_NAME:
+                from transformers import AutoTokenizer
+                _tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_NAME)
+            else:
+                _tokenizer = get_model(DEFAULT_EMB_MODEL).tokenizer
+        return _tokenizer
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    return len(get_tokenizer().encode(text, add_special_tokens=False))
+
+
+def truncate_to_tokens(text, max_tokens):
+    # cut the original string at the end of the last kept token; decoding the ids would
+    # hand back the tokenizer's normalised text (lowercased, accents stripped, [UNK])
+    offsets = get_tokenizer()(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    if len(offsets) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    return text[:offsets[max_tokens - 1][1]]
@@ -0,0 +1,149 @@
+import json
+import time
+import argparse
+from datetime import datetime
+from opensearch_client import get_client, routing_required, forget_routing
+from vectordb_functions import vector_index_body, VECTOR_SHARDS
+
+
+MIGRATION_POLL_SECONDS = 5
+
+
+def _concrete_indices(client, name):
+    if client.indices.exists_alias(name=name):
+        return list(client.indices.get_alias(name=name))
+    return [name]
+
+
+def _set_write_block(client, indices, blocked):
+    client.indices.put_settings(index=",".join(indices), body={"index": {"blocks.write": blocked}})
+
+
+def _wait_for_task(client, task_id, poll_seconds=MIGRATION_POLL_SECONDS):
+    while True:
+        res = client.tasks.get(task_id=task_id)
+        if res.get("completed"):
+            return res
+        status = res.get("task", {}).get("status", {})
+        print(f"Reindexed {status.get('created', 0)}/{status.get('total', 0)} paragraphs")
+        time.sleep(poll_seconds)
+
+
+def migrate_vector_index(index_name="deeprecall-rc-vector", shards=VECTOR_SHARDS, target=None, keep_source=False):
+    client = get_client()
+    if not client.indices.exists(index=index_name):
+        return {"success": False, "error": "INDEX_NOT_FOUND", "index": index_name}
+
+    forget_routing(index_name)
+    if routing_required(index_name):
+        return {"success": True, "index": index_name, "note": "already_routed"}
+
+    sources = _concrete_indices(client, index_name)
+    mappings = client.indices.get_mapping(index=index_name)
+    for source in sources:
+        excludes = mappings[source]["mappings"].get("_source", {}).get("excludes", [])
+        if "embedding" in excludes:
+            # reindex copies _source, so vectors excluded from it cannot be carried over
+            return {
+                "success": False,
+                "error": "EMBEDDINGS_NOT_IN_SOURCE",
+                "message": f"{source} excludes embeddings from _source; re-ingest the documents instead",
+                "index": index_name
+            }
+
+    target = target or f"{index_name}-routed-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    client.indices.create(index=target, body=vector_index_body(shards=shards, routed=True))
+    print(f"Created index: {target} ({shards} shards, routed by doc_id)")
+
+    # writes to the old layout are rejected until the swap, so none can land after the copy
+    _set_write_block(client, sources, True)
+    print(f"Blocked writes to {', '.join(sources)} for the duration of the migration")
+
+    try:
+        # reindex reads through search, so make the last writes before the block visible
+        client.indices.refresh(index=",".join(sources))
+        res = client.reindex(
+            body={
+                "source": {"index": ",".join(sources)},
+                "dest": {"index": target},
+                "script": {
+                    "lang": "painless",
+                    "source": "ctx._routing = ctx._source.doc_id"
+                }
+            },
+            wait_for_completion=False,
+            slices="auto"
+        )
+        task = _wait_for_task(client, res["task"])
+        response = task.get("response", {})
+        if task.get("error") or response.get("failures"):
+            client.indices.delete(index=target)
+            _set_write_block(client, sources, False)
+            return {
+                "success": False,
+                "error": "REINDEX_FAILED",
+                "message": json.dumps(task.get("error") or response.get("failures")[:5], default=str),
+                "index": index_name
+            }
+
+        client.indices.refresh(index=target)
+        source_count = client.count(index=index_name)["count"]
+        target_count = client.count(index=target)["count"]
+        if source_count != target_count:
+            client.indices.delete(index=target)
+            _set_write_block(client, sources, False)
+            return {
+                "success": False,
+                "error": "COUNT_MISMATCH",
+                "message": f"{index_name} has {source_count} paragraphs, {target} has {target_count}",
+                "index": index_name
+            }
+    except Exception:
+        client.indices.delete(index=target, ignore_unavailable=True)
+        _set_write_block(client, sources, False)
+        raise
+
+    # the old name becomes an alias of the routed index in a single atomic step, so
+    # readers and writers using it never see a missing index
+    if index_name in sources:
+        actions = [{"remove_index": {"index": index_name}}]
+    else:
+        actions = [{"remove": {"index": source, "alias": index_name}} for source in sources]
+    actions.append({"add": {"index": target, "alias": index_name}})
+    client.indices.update_aliases(body={"actions": actions})
+    forget_routing(index_name)
+
+    note = None
+    if index_name in sources:
+        if keep_source:
+            # the old concrete index had to go for its name to become the alias
+            note = "keep_source_ignored: the source was a concrete index and was replaced by the alias"
+    elif keep_source:
+        _set_write_block(client, sources, False)
+    else:
+        client.indices.delete(index=",".join(sources))
+
+    print(f"Migrated {target_count} paragraphs from {', '.join(sources)} to {target}")
+    return {
+        "success": True,
+        "index": index_name,
+        "target": target,
+        "shards": shards,
+        "paragraphs": target_count,
+        "sources": sources,
+        "note": note
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move a paragraph vector index to the doc_id-routed layout")
+    parser.add_argument("--index", default="deeprecall-rc-vector")
+    parser.add_argument("--shards", type=int, default=VECTOR_SHARDS)
+    parser.add_argument("--target", help="name of the new concrete index")
+    parser.add_argument("--keep-source", action="store_true", help="keep the old index behind a previous alias")
+    args = parser.parse_args()
+
+    print(json.dumps(
+        migrate_vector_index(args.index, shards=args.shards, target=args.target, keep_source=args.keep_source),
+        indent=2
+    ))
@@ -111,107 +111,413 @@ if __name__ == "__main__":
 
 
 
-from opensearchpy import OpenSearch
-from opensearchpy.exceptions import RequestError
-from sentence_transformers import SentenceTransformer
+import os
+from collections import deque
+from opensearchpy import helpers
+from embedding_models import get_model, DEFAULT_EMB_MODEL
+from opensearch_client import get_client, replica_settings, routing_required, forget_routing
 from datetime import datetime
 
 
-client = OpenSearch(
-    hosts=[{'host': 'localhost', 'port': 9200}],
-    http_auth=("admin", "'Deeprecall@123'"),
-    use_ssl=True,
-    verify_certs=False
-)
-
-try:
-    info = client.info()
-    print("Connected to OpenSearch cluster:", info["cluster_name"])
-except Exception as e:
-    print("Connection failed:", e)
-    exit(1)
+EMB_BATCH_SIZE = int(os.getenv("DEEPRECALL_EMB_BATCH_SIZE", "64"))
+BULK_CHUNK_SIZE = int(os.getenv("DEEPRECALL_BULK_CHUNK_SIZE", "500"))
+BULK_MAX_CHUNK_BYTES = int(os.getenv("DEEPRECALL_BULK_MAX_CHUNK_BYTES", str(10 * 1024 * 1024)))
+
+
+EMB_DIMENSION = 384
+
+KNN_ENGINE = os.getenv("DEEPRECALL_KNN_ENGINE", "lucene")
+KNN_SPACE_TYPE = os.getenv("DEEPRECALL_KNN_SPACE_TYPE", "cosinesimil")
+HNSW_M = int(os.getenv("DEEPRECALL_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("DEEPRECALL_HNSW_EF_CONSTRUCTION", "128"))
+HNSW_EF_SEARCH = int(os.getenv("DEEPRECALL_HNSW_EF_SEARCH", "100"))
+
+# keeping vectors out of _source shrinks the index on disk, but documents can then
+# only be reindexed by re-embedding their text
+VECTOR_SOURCE_EXCLUDES = os.getenv("DEEPRECALL_VECTOR_SOURCE_EXCLUDES", "0") == "1"
+PARA_SOURCE_FIELDS = ["doc_id", "page_no", "para_no", "text"]
+
+PARA_SEARCH_MODE = os.getenv("DEEPRECALL_PARA_SEARCH_MODE", "lexical")
+# share of the hybrid score taken by the kNN side once both sides are normalised to [0, 1]
+HYBRID_VECTOR_WEIGHT = float(os.getenv("DEEPRECALL_HYBRID_VECTOR_WEIGHT", "0.5"))
+PARAS_PER_DOC = int(os.getenv("DEEPRECALL_PARAS_PER_DOC", "3"))
+
+# new vector indices route every paragraph by doc_id, so one document lives on one shard
+# and per-document searches and deletes hit only that shard
+VECTOR_SHARDS = int(os.getenv("DEEPRECALL_VECTOR_SHARDS", "2"))
+VECTOR_ROUTING = os.getenv("DEEPRECALL_VECTOR_ROUTING", "1") == "1"
+
+
+def vector_index_body(
+    m=HNSW_M,
+    ef_construction=HNSW_EF_CONSTRUCTION,
+    ef_search=HNSW_EF_SEARCH,
+    exclude_vectors_from_source=VECTOR_SOURCE_EXCLUDES,
+    shards=VECTOR_SHARDS,
+    routed=VECTOR_ROUTING
+):
+    body = {
+        "settings": {
+            "index": {
+                "number_of_shards": shards,
+                "knn": True,
+                **replica_settings()
+            }
+        },
+        "mappings": {
+            "properties": {
+                "doc_id": {"type": "keyword"},
+                "page_no": {"type": "integer"},
+                "para_no": {"type": "integer"},
+                "text": {"type": "text"},
+                "embedding": {
+                    "type": "knn_vector",
+                    "dimension": EMB_DIMENSION,
+                    "method": {
+                        "name": "hnsw",
+                        "engine": KNN_ENGINE,
+                        "space_type": KNN_SPACE_TYPE,
+                        "parameters": {
+                            "m": m,
+                            "ef_construction": ef_construction
+                        }
+                    }
+                }
+            }
+        }
+    }
 
+    if KNN_ENGINE != "lucene":
+        # the lucene engine ignores this index setting and only honours the query-time
+        # method_parameters.ef_search sent by knn_clause
+        body["settings"]["index"]["knn.algo_param.ef_search"] = ef_search
+    if exclude_vectors_from_source:
+        body["mappings"]["_source"] = {"excludes": ["embedding"]}
+    if routed:
+        # rejects writes without a routing value, so no paragraph lands on the wrong shard
+        body["mappings"]["_routing"] = {"required": True}
+    return body
 
-def input_doc(doc_id, index_name, text, emb_model, metadata=None):
-    global client
-    model = SentenceTransformer(emb_model)
 
+def ensure_vector_index(index_name, **hnsw_params):
+    client = get_client()
     if not client.indices.exists(index=index_name):
-        client.indices.create(
-            index=index_name,
-            body={
-                "mappings": {
-                    "properties": {
-                        "doc_id": {"type": "keyword"},
-                        "page_no": {"type": "integer"},
-                        "para_no": {"type": "integer"},
-                        "embedding": {"type": "knn_vector", "dimension": 384}
-                    }
-                }
-            }
-        )
+        client.indices.create(index=index_name, body=vector_index_body(**hnsw_params))
+        forget_routing(index_name)
         print(f"Created index: {index_name}")
 
-    chunks = [pg.split("\n") for pg in text]
 
-    for idx, page_text in enumerate(text, start=1):
-        for pidx, para in enumerate(chunks[idx - 1], start=1):
-            emb = model.encode(para).tolist()
-            unique_id = f"{doc_id}_page_{idx}_para_{pidx}"
+def iter_paragraphs(pages):
+    for idx, page_text in enumerate(pages, start=1):
+        for pidx, para in enumerate(page_text.split("\n"), start=1):
+            yield idx, pidx, para
+
+
+def iter_embedding_batches(paragraphs, model, batch_size=EMB_BATCH_SIZE):
+    batch = []
+    for item in paragraphs:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch, model.encode([para for _, _, para in batch], batch_size=batch_size)
+            batch = []
 
+    if batch:
+        yield batch, model.encode([para for _, _, para in batch], batch_size=batch_size)
+
+
+def iter_bulk_actions(doc_id, index_name, batches, metadata=None):
+    for batch, embeddings in batches:
+        for (idx, pidx, para), emb in zip(batch, embeddings):
             doc_body = {
                 "doc_id": doc_id,
                 "page_no": idx,
                 "para_no": pidx,
                 "text": para,
-                "embedding": emb,
+                "embedding": emb.tolist(),
                 "timestamp": datetime.now()
             }
 
             if metadata:
                 doc_body.update(metadata)
 
-            try:
-                client.index(index=index_name, id=unique_id, body=doc_body)
-                print(f"Indexed {unique_id}")
-            except RequestError as e:
-                print(f"Failed to index {unique_id}: {e}")
+            yield {
+                "_op_type": "index",
+                "_index": index_name,
+                "_id": f"{doc_id}_page_{idx}_para_{pidx}",
+                "_source": doc_body
+            }
+
+
+def _routing_missing(error):
+    return isinstance(error, dict) and error.get("type") == "routing_missing_exception"
+
+
+def input_doc(
+    doc_id,
+    index_name,
+    text,
+    emb_model,
+    metadata=None,
+    batch_size=EMB_BATCH_SIZE,
+    chunk_size=BULK_CHUNK_SIZE,
+    max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+    on_indexed=None
+):
+    client = get_client()
+    model = get_model(emb_model)
+    ensure_vector_index(index_name)
+
+    result = {
+        "success": True,
+        "doc_id": doc_id,
+        "index": index_name,
+        "indexed": 0,
+        "failed": []
+    }
+
+    # pages -> paragraphs -> embedding batches -> bulk actions, all lazy, so memory is
+    # bounded by one embedding batch plus one bulk chunk regardless of page count
+    batches = iter_embedding_batches(iter_paragraphs(text), model, batch_size)
+    routed = [routing_required(index_name)]
+    # actions sent but not yet acknowledged; streaming_bulk reports results in order,
+    # so this holds at most one bulk chunk
+    in_flight = deque()
+    retry = []
+
+    def routed_actions(actions):
+        for action in actions:
+            if routed[0]:
+                action["_routing"] = doc_id
+            in_flight.append(action)
+            yield action
+
+    def send(actions, allow_retry):
+        for ok, item in helpers.streaming_bulk(
+            client,
+            routed_actions(actions),
+            chunk_size=chunk_size,
+            max_chunk_bytes=max_chunk_bytes,
+            raise_on_error=False,
+            raise_on_exception=False
+        ):
+            action = in_flight.popleft()
+            if ok:
+                result["indexed"] += 1
+                if on_indexed:
+                    on_indexed()
+                continue
+
+            op = item.get("index", item)
+            if allow_retry and not routed[0] and _routing_missing(op.get("error")):
+                # the index was migrated to the routed layout by another process mid-ingest
+                forget_routing(index_name)
+                routed[0] = True
+                retry.append(action)
+                continue
+
+            result["failed"].append({
+                "id": op.get("_id"),
+                "status": op.get("status"),
+                "error": op.get("error")
+            })
+
+    send(iter_bulk_actions(doc_id, index_name, batches, metadata), allow_retry=True)
+    if retry:
+        send(retry, allow_retry=False)
+
+    if result["failed"]:
+        result["success"] = False
+        print(f"Failed to index {len(result['failed'])} paragraphs of {doc_id}")
+
+    print(f"Indexed {result['indexed']} paragraphs of {doc_id} into {index_name}")
+    return result
+
+
+def knn_clause(query_vector, k, filters=None, ef_search=HNSW_EF_SEARCH):
+    knn = {
+        "vector": query_vector,
+        "k": k,
+        "method_parameters": {"ef_search": ef_search}
+    }
+    if filters:
+        # efficient (pre-)filtering inside the ANN search, so k hits come from the candidates
+        knn["filter"] = {"bool": {"filter": filters}}
+    return {"knn": {"embedding": knn}}
+
+
+def _min_max(hits):
+    scores = [hit.get("_score") or 0.0 for hit in hits]
+    if not scores:
+        return {}
+    low, high = min(scores), max(scores)
+    return {
+        hit["_id"]: ((hit.get("_score") or 0.0) - low) / (high - low) if high > low else 1.0
+        for hit in hits
+    }
 
 
-def get_paras(index_name, doc_ids, query_text=None, k=3):
-    
-    must_clauses = []
+def fuse_hybrid(lexical_hits, vector_hits, vector_weight=HYBRID_VECTOR_WEIGHT):
+    # BM25 scores are unbounded while cosine kNN scores sit in [0, 1]; min-max each list
+    # onto [0, 1] before the weighted sum (what OpenSearch's normalization-processor does)
+    # so the vector side actually moves the ranking
+    lexical = _min_max(lexical_hits)
+    vector = _min_max(vector_hits)
+    by_id = {hit["_id"]: hit for hit in lexical_hits + vector_hits}
 
-    if query_text:
-        must_clauses.append({
-            "match": {"text": {"query": query_text}}
-        })
+    fused = [
+        dict(hit, _score=(1 - vector_weight) * lexical.get(hit_id, 0.0) + vector_weight * vector.get(hit_id, 0.0))
+        for hit_id, hit in by_id.items()
+    ]
+    fused.sort(key=lambda hit: hit["_score"], reverse=True)
+    return fused
+
+
+def _collapsed_hits(response):
+    hits = []
+    for group in response["hits"]["hits"]:
+        hits.extend(group.get("inner_hits", {}).get("top_paras", {}).get("hits", {}).get("hits", []))
+    return hits
+
+
+def get_paras(
+    index_name,
+    doc_ids,
+    query_text=None,
+    k=3,
+    mode=PARA_SEARCH_MODE,
+    emb_model=DEFAULT_EMB_MODEL,
+    ef_search=HNSW_EF_SEARCH,
+    vector_weight=HYBRID_VECTOR_WEIGHT,
+    source_fields=PARA_SOURCE_FIELDS,
+    per_doc=None,
+    doc_weights=None
+):
+    if mode not in ("lexical", "vector", "hybrid"):
+        raise ValueError(f"Unknown paragraph search mode: {mode}")
+
+    if isinstance(doc_ids, str):
+        doc_ids = [doc_ids]
+
+    filters = []
     print(doc_ids)
     if doc_ids:
-        must_clauses.append({"term": {"doc_id": doc_ids}})
-
-    query_body = {
-        "size": k,
-        "query": {
-            "bool": {
-                "must": must_clauses
+        # one terms filter covers every candidate document in a single request
+        filters.append({"terms": {"doc_id": doc_ids}})
+
+    # with a per-document cap the kNN side must surface per_doc hits for every document;
+    # the result itself is still cut to k
+    candidates = max(k, per_doc * len(doc_ids)) if per_doc and doc_ids else k
+    collapse = bool(per_doc and doc_ids)
+
+    def search_body(query):
+        body = {
+            "size": k,
+            "_source": source_fields,
+            "query": query
+        }
+        if collapse:
+            # field collapsing returns one group per document; inner_hits carries its top paragraphs
+            body["size"] = len(doc_ids)
+            body["collapse"] = {
+                "field": "doc_id",
+                "inner_hits": {
+                    "name": "top_paras",
+                    "size": per_doc,
+                    "_source": source_fields
+                }
             }
+        return body
+
+    lexical_query = {
+        "bool": {
+            "must": filters + ([{"match": {"text": {"query": query_text}}}] if query_text else [])
         }
     }
 
-    response = client.search(index=index_name, body=query_body)
-    
+    # on the routed layout only the shards holding the candidate documents are searched
+    routing = ",".join(doc_ids) if doc_ids and routing_required(index_name) else None
+    client = get_client()
+
+    if mode == "hybrid" and query_text:
+        # embed the query once and reuse the registry model loaded for ingestion
+        query_vector = get_model(emb_model).encode(query_text).tolist()
+        vector_query = knn_clause(query_vector, candidates, filters, ef_search)
+
+        # both sides in one round trip, fused after normalising their scores
+        header = {"index": index_name}
+        if routing:
+            header["routing"] = routing
+        lexical_res, vector_res = client.msearch(body=[
+            header, search_body(lexical_query),
+            header, search_body(vector_query)
+        ])["responses"]
+        for res in (lexical_res, vector_res):
+            if "error" in res:
+                raise RuntimeError(f"Paragraph search failed: {res['error']}")
+
+        extract = _collapsed_hits if collapse else (lambda res: res["hits"]["hits"])
+        hits = fuse_hybrid(extract(lexical_res), extract(vector_res), vector_weight)
+
+        if doc_weights:
+            # scale each document's paragraph scores by its upstream (fuzzy metadata) rank weight
+            for hit in hits:
+                hit["_score"] *= doc_weights.get(hit["_source"].get("doc_id"), 1.0)
+            hits.sort(key=lambda hit: hit["_score"], reverse=True)
+
+        if collapse:
+            # each side kept per_doc hits per document; keep the cap on their union
+            kept = {}
+            capped = []
+            for hit in hits:
+                doc_id = hit["_source"].get("doc_id")
+                if kept.get(doc_id, 0) < per_doc:
+                    kept[doc_id] = kept.get(doc_id, 0) + 1
+                    capped.append(hit)
+            hits = capped
+
+        response = lexical_res
+        response["hits"]["hits"] = hits[:k]
+    else:
+        if mode == "vector" and query_text:
+            query = knn_clause(get_model(emb_model).encode(query_text).tolist(), candidates, filters, ef_search)
+        else:
+            query = lexical_query
+
+        if doc_weights:
+            # scale each document's paragraph scores by its upstream (fuzzy metadata) rank weight
+            query = {
+                "function_score": {
+                    "query": query,
+                    "functions": [
+                        {"filter": {"term": {"doc_id": doc_id}}, "weight": weight}
+                        for doc_id, weight in doc_weights.items()
+                    ],
+                    "score_mode": "first",
+                    "boost_mode": "multiply"
+                }
+            }
+
+        response = client.search(index=index_name, body=search_body(query), routing=routing)
+        if collapse:
+            hits = _collapsed_hits(response)
+            hits.sort(key=lambda hit: hit.get("_score") or 0.0, reverse=True)
+            response["hits"]["hits"] = hits[:k]
+
     print(f"\nTop {len(response['hits']['hits'])} Results:")
     for hit in response["hits"]["hits"]:
         src = hit["_source"]
         print(f"Score: {hit['_score']:.2f}")
-        print(f"Doc ID: {src['doc_id']}, Page {src['page_no']}, Para {src['para_no']}")
-        print(f"Text: {src['text'][:200]}...")
+        print(f"Doc ID: {src.get('doc_id')}, Page {src.get('page_no')}, Para {src.get('para_no')}")
+        print(f"Text: {src.get('text', '')[:200]}...")
     return response
 
 def clear_vector_index(index_name="deeprecall-rc-vector"):
+    client = get_client()
     if client.indices.exists(index=index_name):
-        client.indices.delete(index=index_name)
+        # after a layout migration the name is an alias; drop the index behind it
+        targets = list(client.indices.get_alias(name=index_name)) if client.indices.exists_alias(name=index_name) else [index_name]
+        client.indices.delete(index=",".join(targets))
+        forget_routing(index_name)
         print(f"Index '{index_name}' deleted successfully.")
     else:
         print(f"Index '{index_name}' does not exist.")